@@ -2,16 +2,36 @@
 import pandas as pd
 
 import os
+import hmac
+import json
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from functions.plot_energy_type import plot_energy_type
 from functions.plot_energy_consumption_pie import plot_energy_consumption_pie
 from functions.plot_renewable_vs_non import plot_renewable_vs_non
 from functions.plot_energy_consumption_trend import plot_energy_consumption_trend
 from functions.predict_consumption import predict_consumption
-from cols_to_check import features
+from functions.model_registry import registry_stats
+from functions.predict_energy_year import predictions_up_to_year
+from functions.batched_inference import forecast_all_energy_types
+from functions.load_cleaned_dataset import shared_memory_cache_dir
+from functions.dataset_manager import DatasetManager, DatasetNotLoaded, check_refresh_url
+from functions.job_queue import JobQueue
+from functions.forecast_store import configure_forecast_store, forecast_store_stats
+from functions.precomputed_forecasts import configure_precomputed_forecasts, precomputed_stats
+from functions.dataset_index import get_dataset_index
+from functions.filter_energy_data import country_year_range, filter_energy_data
+from functions.response_cache import get_or_render, configure_response_cache, response_cache_stats, clear_response_cache
+from functions.plot_renderer import configure_rendering, rendering_signature, render_settings
+from functions.save_plot import plot_outputs
+from functions.metrics import stage, start_request, finish_request, server_timing, add_collector, prometheus_text, current_stages, stages_of
+from functions.profiler import RequestProfiler, profile_modes
+from functions.warmup import load_warmup_spec, run_warmup, warmup_completed, warmup_status
 from functions.plot_energy_consumption_over_time import plot_energy_consumption_over_time
 from functions.plot_renewable_energy_sources_over_time import plot_renewable_energy_sources_over_time
 from functions.get_energy import (
+    energy_rollups,
     get_energy_consumption, 
     get_energy_consumption_by_type_and_year_for_country, 
     get_energy_consumption_by_year, 
@@ -22,7 +42,7 @@ from functions.get_energy import (
 
 
 # import flask to create a server and send api
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Blueprint, request, jsonify, render_template_string, Response, stream_with_context
 
 from flask_cors import CORS  # Import CORS
 
@@ -33,75 +53,95 @@ from flask_cors import CORS  # Import CORS
 file_path = 'owid-energy-data.csv'
 url = 'https://nyc3.digitaloceanspaces.com/owid-public/data/energy/owid-energy-data.csv'
 
-# Check if the file exists
-if not os.path.exists(file_path):
-    print("File does not exist. Downloading...")
-    # Download the file
-    dataset = pd.read_csv(url)
-    # Save the file locally
-    dataset.to_csv(file_path, index=False)
-    print("File downloaded and saved.")
-else:
-    print("File already exists.")
-
-# Load the dataset
-dataset = pd.read_csv(file_path)
-# print(dataset.head())
-
-# # Inspect the data
-# print('Dataset info>>>>')
-# print(dataset.info())
-# print('<<<<<')
-total_rows = dataset.shape[0]  # Number of rows
-# print(f"Total rows in dataset: {total_rows}")
-
-# Drop unnecessary columns:
-dataset.drop(columns=['iso_code'], inplace=True)
-
-# Check for missing values and replace them with zeros
-missing_values = dataset.isnull().sum()
-dataset = dataset.fillna(0)
-
-# Convert year to integer type
-dataset['year'] = dataset['year'].astype(int)
-
-# Columns to exclude from conversion
-exclude_columns = ['country', 'year', 'iso_code', 'population', 'gdp']
-
-# Convert all other columns to float
-for col in dataset.columns:
-    if col not in exclude_columns:
-        dataset[col] = dataset[col].astype(float)
-        
-# Check for duplicate rows
-duplicate_rows = dataset.duplicated()
-num_duplicates = duplicate_rows.sum()
-print(f"Number of duplicate rows: {num_duplicates}")
-
-# Display duplicate rows if any
-if num_duplicates > 0:
-    print(dataset[duplicate_rows])
-    dataset = dataset.drop_duplicates()
-
-# Keep only the columns that actually exist in the DataFrame
-existing_cols = [col for col in features if col in dataset.columns]
-
-# Drop rows where all these columns are 0
-if existing_cols:
-    dataset = dataset[dataset[existing_cols].ne(0).any(axis=1)]
-total_rows = dataset.shape[0]  # Number of rows
-# print(f"Total rows in dataset: {total_rows}")
-# Save Cleaned Data: Save the cleaned dataset.
-dataset.to_csv('cleaned_dataset.csv', index=False)
+# Importing this module only defines the routes: create_app (at the end) configures them, starts
+# loading the dataset and returns the Flask app. It sets the dataset manager, the pool rendering the
+# /plot_batch charts, the forecast job queue and the admin token below, which the handlers use.
+dataset_manager = None
+dataset_loading = 'background'
+plot_executor = None
+job_queue = None
+admin_token = None
+refresh_hosts = set()
+
+# Profiles the requests of the live server on demand (POST /admin/profile)
+request_profiler = RequestProfiler()
+
+routes = Blueprint('rect', __name__)
+
+def current_dataset():
+    # The ServedDataset snapshot a request works on; DatasetNotLoaded (503) while the dataset is loading,
+    # except in lazy mode, where the first request that needs it loads it
+    if dataset_loading == 'lazy' and dataset_manager.current() is None:
+        try:
+            return dataset_manager.load()
+        except Exception:
+            pass
+    return dataset_manager.require()
 
 renewable_sources = ['wind_consumption', 'solar_consumption', 'hydro_consumption', 'biofuel_consumption']
 non_renewable_sources = ['coal_consumption', 'oil_consumption', 'gas_consumption', 'nuclear_consumption', 'fossil_fuel_consumption']
 
-# Initialize the Flask app
-app = Flask(__name__)
-CORS(app)
-
-@app.route('/')
+def resolved_years(data, country, start_year, end_year):
+    # The years filter_energy_data clamps the range to, so equivalent ranges share a cache entry
+    try:
+        return country_year_range(data, country, start_year, end_year)
+    except ValueError:
+        return start_year, end_year
+
+def cached_plot(route, params, render, served):
+    def timed_render():
+        # building the chart on a cache miss: its filter and render stages are counted in it
+        with stage('chart'):
+            return render()
+    return get_or_render(route, params, f"{served.fingerprint}:{rendering_signature()}", timed_render)
+
+def requested_format(args):
+    # ?format=html (default: data + <img> tag), data (no image is rendered), png or svg (the image itself);
+    # ?thumbnail=1 renders the image at the small preview resolution
+    output = args.get('format', 'html')
+    if output not in plot_outputs:
+        return None
+    dpi = render_settings['thumbnail_dpi'] if str(args.get('thumbnail', '')).lower() in ('1', 'true') else None
+    return {'output': output, 'dpi': dpi}
+
+def plot_response(result):
+    # png / svg are sent as the image, with an ETag so an unchanged chart is answered with 304 Not Modified
+    if 'image' in result:
+        response = Response(result['image'], mimetype=result['mimetype'])
+        response.set_etag(result['etag'])
+        return response.make_conditional(request)
+    return result
+
+format_error = {"error": f"Format parameter must be one of: {', '.join(plot_outputs)}"}
+
+# Latency of every request by route, and of its stages (filter, chart, render, model_load, predict, ...),
+# exported on /metrics and sent back in the Server-Timing header
+@routes.before_app_request
+def start_request_metrics():
+    start_request()
+    # the admin routes (polling the profile itself) are never profiled, and nothing is without an ADMIN_TOKEN
+    if admin_token and not request.path.startswith('/admin/'):
+        request_profiler.request_started(request.path)
+
+@routes.after_app_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    # streamed responses (ndjson) have no size yet
+    size = None if response.is_streamed else response.calculate_content_length()
+    seconds, stages = finish_request(route, request.method, response.status_code, size)
+    response.headers['Server-Timing'] = server_timing(seconds, stages)
+    return response
+
+@routes.teardown_app_request
+def finish_request_profile(error=None):
+    request_profiler.request_finished()
+
+@routes.route('/metrics', methods=['GET'])
+def metrics_api():
+    # Prometheus text format: latency and size histograms, and the counters of the caches, the registry and the jobs
+    return Response(prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/')
 def home():
     available_links = [
         "/plot_energy_type?country=Germany&energy_type=solar_electricity&start_year=2000&end_year=2023",
@@ -131,8 +171,62 @@ def home():
     ''')
 
 
+# Each chart is described by the route it is served on, the parameters its cache entry is keyed
+# by, a function rendering it and the dataset snapshot it is rendered from. The single-chart routes
+# and /plot_batch share these, so a chart rendered by either one is cached for both.
+
+def output_params(output, dpi):
+    # html is the default output and stays out of the key, so existing cache entries keep their keys
+    return {'output': None if output == 'html' else output, 'dpi': dpi}
+
+def energy_type_chart(country, energy_type=None, start_year=None, end_year=None, filtered_data=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    # both years are part of the key when given, they decide the title
+    new_start_year, new_end_year = resolved_years(served.data, country, start_year, end_year)
+    params = {'country': country, 'energy_type': energy_type, 'start_year': new_start_year, 'end_year': new_end_year, **output_params(output, dpi)}
+    return '/plot_energy_type', params, lambda: plot_energy_type(served.data, country, energy_type, start_year, end_year, filtered_data=filtered_data, output=output, dpi=dpi), served
+
+def energy_consumption_pie_chart(country, year=None, energy_type=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    if energy_type == "renewable":
+        energy_sources = renewable_sources
+        pie_title = 'Renewable '
+    elif energy_type == "non_renewable":
+        energy_sources = non_renewable_sources
+        pie_title = 'Non-Renewable '
+    else:
+        energy_sources = renewable_sources + non_renewable_sources
+        pie_title = ''
+
+    params = {'country': country, 'year': year, 'energy_sources': energy_sources, **output_params(output, dpi)}
+    return '/plot_energy_consumption_pie', params, lambda: plot_energy_consumption_pie(served.data, energy_sources, country, year, pie_title, output=output, dpi=dpi), served
+
+def renewable_vs_non_chart(country, start_year=None, end_year=None, filtered_data=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    new_start_year, new_end_year = resolved_years(served.data, country, start_year, end_year)
+    params = {'country': country, 'start_year': new_start_year, 'end_year': new_end_year, **output_params(output, dpi)}
+    return '/plot_renewable_vs_non', params, lambda: plot_renewable_vs_non(served.data, country, start_year, end_year, filtered_data=filtered_data, output=output, dpi=dpi), served
+
+def energy_consumption_trend_chart(country, start_year=None, end_year=None, filtered_data=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    new_start_year, new_end_year = resolved_years(served.data, country, start_year, end_year)
+    params = {'country': country, 'start_year': new_start_year, 'end_year': new_end_year, **output_params(output, dpi)}
+    return '/plot_energy_consumption_trend', params, lambda: plot_energy_consumption_trend(served.data, country, start_year, end_year, filtered_data=filtered_data, output=output, dpi=dpi), served
+
+def energy_consumption_over_time_chart(country=None, start_year=None, end_year=None, energy_types=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    # the plot treats a missing country or year as 'World' / no limit
+    params = {'country': country or 'World', 'start_year': start_year or None, 'end_year': end_year or None, 'energy_types': energy_types, **output_params(output, dpi)}
+    return '/plot_energy_consumption_over_time', params, lambda: plot_energy_consumption_over_time(served.data, country, start_year=start_year, end_year=end_year, energy_types = energy_types, output=output, dpi=dpi), served
+
+def renewable_energy_sources_over_time_chart(start_year=None, output='html', dpi=None, served=None):
+    served = served or current_dataset()
+    params = {'start_year': start_year or None, **output_params(output, dpi)}
+    return '/plot_renewable_energy_sources_over_time', params, lambda: plot_renewable_energy_sources_over_time(served.data, start_year=start_year, output=output, dpi=dpi), served
+
+
 # Define the API endpoint
-@app.route('/plot_energy_type', methods=['GET'])
+@routes.route('/plot_energy_type', methods=['GET'])
 def plot_energy_type_api():
     country = request.args.get('country')
     energy_type = request.args.get('energy_type')
@@ -142,11 +236,15 @@ def plot_energy_type_api():
     if not country:
         return jsonify({"error": "Country parameter is required"}), 400
     
-    plot_html = plot_energy_type(dataset, country, energy_type, start_year, end_year)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
+
+    plot_html = cached_plot(*energy_type_chart(country, energy_type, start_year, end_year, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
 
-@app.route('/plot_energy_consumption_pie', methods=['GET'])
+@routes.route('/plot_energy_consumption_pie', methods=['GET'])
 def plot_energy_consumption_pie_api():
     country = request.args.get('country')
     year = request.args.get('year', type=int)
@@ -157,61 +255,164 @@ def plot_energy_consumption_pie_api():
     if not year:
         return jsonify({"error": "Year parameter is required"}), 400
     
-    if energy_type == "renewable":
-        energy_sources = renewable_sources
-        pie_title = 'Renewable '
-    elif energy_type == "non_renewable":
-        energy_sources = non_renewable_sources
-        pie_title = 'Non-Renewable '
-    else:
-        energy_sources = renewable_sources + non_renewable_sources
-        pie_title = ''
-    
-    plot_html = plot_energy_consumption_pie(dataset, energy_sources, country, year, pie_title)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
 
-@app.route('/plot_renewable_vs_non', methods=['GET'])
+    plot_html = cached_plot(*energy_consumption_pie_chart(country, year, energy_type, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
+
+@routes.route('/plot_renewable_vs_non', methods=['GET'])
 def plot_renewable_vs_non_api():
     country = request.args.get('country')
     start_year = request.args.get('start_year', type=int)
     end_year = request.args.get('end_year', type=int)
 
-    plot_html = plot_renewable_vs_non(dataset, country, start_year, end_year)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
+
+    plot_html = cached_plot(*renewable_vs_non_chart(country, start_year, end_year, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
 
-@app.route('/plot_energy_consumption_trend', methods=['GET'])
+@routes.route('/plot_energy_consumption_trend', methods=['GET'])
 def plot_energy_consumption_trend_api():
     country = request.args.get('country')
     start_year = request.args.get('start_year', type=int)
     end_year = request.args.get('end_year', type=int)
     
-    plot_html = plot_energy_consumption_trend(dataset, country, start_year, end_year)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
 
+    plot_html = cached_plot(*energy_consumption_trend_chart(country, start_year, end_year, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
 
-@app.route('/plot_energy_consumption_over_time', methods=['GET'])
+
+@routes.route('/plot_energy_consumption_over_time', methods=['GET'])
 def plot_energy_consumption_over_time_api():
     country = request.args.get('country')
     start_year = request.args.get('start_year', type=int)
     end_year = request.args.get('end_year', type=int)
     energy_types = request.args.getlist('energy_types') or None   
-    plot_html = plot_energy_consumption_over_time(dataset, country, start_year=start_year, end_year=end_year, energy_types = energy_types)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
+
+    plot_html = cached_plot(*energy_consumption_over_time_chart(country, start_year, end_year, energy_types, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
 
 
-@app.route('/plot_renewable_energy_sources_over_time', methods=['GET'])
+@routes.route('/plot_renewable_energy_sources_over_time', methods=['GET'])
 def plot_renewable_energy_sources_over_time_api():
     start_year = request.args.get('start_year', type=int)
-    plot_html = plot_renewable_energy_sources_over_time(dataset, start_year=start_year)
-    #to return the image only => plot_html['img']
-    return plot_html
+    plot_format = requested_format(request.args)
+    if plot_format is None:
+        return jsonify(format_error), 400
+
+    plot_html = cached_plot(*renewable_energy_sources_over_time_chart(start_year, **plot_format))
+    #to return the image only => plot_html['img'] (or ?format=png)
+    return plot_response(plot_html)
+
+
+# Charts that can be requested together from /plot_batch, and the spec keys each one takes
+# besides the shared country / start_year / end_year
+batch_charts = {
+    'energy_type': (energy_type_chart, ['energy_type']),
+    'energy_consumption_pie': (energy_consumption_pie_chart, ['year', 'energy_type']),
+    'renewable_vs_non': (renewable_vs_non_chart, []),
+    'energy_consumption_trend': (energy_consumption_trend_chart, []),
+    'energy_consumption_over_time': (energy_consumption_over_time_chart, ['energy_types']),
+}
+# charts drawn from filter_energy_data(country, start_year, end_year), which the batch runs only once
+filtered_charts = ['energy_type', 'renewable_vs_non', 'energy_consumption_trend']
+takes_year_range = filtered_charts + ['energy_consumption_over_time']
+
+def render_batch_chart(spec, country, start_year, end_year, filtered_data, served, output='html', dpi=None):
+    chart = spec.get('chart')
+    if chart not in batch_charts:
+        raise ValueError(f"Unknown chart '{chart}'. Available charts: {', '.join(batch_charts)}")
+
+    chart_function, spec_keys = batch_charts[chart]
+    arguments = {key: spec.get(key) for key in spec_keys}
+    chart_country = spec.get('country', country)
+    if chart in takes_year_range:
+        arguments.update(start_year=spec.get('start_year', start_year), end_year=spec.get('end_year', end_year))
+    # a chart overriding the shared country or range can't use the shared filtered data
+    if chart in filtered_charts and chart_country == country and (arguments['start_year'], arguments['end_year']) == (start_year, end_year):
+        arguments['filtered_data'] = filtered_data
+    return cached_plot(*chart_function(chart_country, output=output, dpi=dpi, served=served, **arguments))
+
+def render_warmup_chart(spec, served):
+    # Renders a chart spec of the warm-up (warmup.json) into the response cache: a /plot_batch chart spec
+    # with its country, years and format, or {"chart": "renewable_energy_sources_over_time", "start_year": ...}
+    plot_format = requested_format({'format': spec.get('format', 'html'), 'thumbnail': spec.get('thumbnail')})
+    if plot_format is None:
+        raise ValueError(format_error['error'])
+    if spec.get('chart') == 'renewable_energy_sources_over_time':
+        return cached_plot(*renewable_energy_sources_over_time_chart(spec.get('start_year'), served=served, **plot_format))
+    return render_batch_chart(spec, spec.get('country'), spec.get('start_year'), spec.get('end_year'), None, served, **plot_format)
+
+@routes.route('/plot_batch', methods=['POST'])
+def plot_batch_api():
+    # Renders several charts of one country / year range in one request, e.g. everything a CountryPage shows:
+    # {"country": "Germany", "start_year": 2000, "end_year": 2023, "stream": false, "format": "data", "thumbnail": false,
+    #  "charts": [{"chart": "energy_type", "energy_type": "solar_electricity"}, {"chart": "renewable_vs_non"},
+    #             {"chart": "energy_consumption_pie", "year": 2023, "energy_type": "renewable"}]}
+    body = request.get_json(silent=True) or {}
+    country = body.get('country')
+    start_year = body.get('start_year')
+    end_year = body.get('end_year')
+    charts = body.get('charts')
 
+    if not country:
+        return jsonify({"error": "Country parameter is required"}), 400
+    if not isinstance(charts, list) or not charts:
+        return jsonify({"error": "Charts parameter is required"}), 400
 
-@app.route('/predict_consumption', methods=['GET'])
+    # the charts come back in one JSON document, so only the data and html outputs can be batched
+    plot_format = requested_format({'format': body.get('format', 'html'), 'thumbnail': body.get('thumbnail')})
+    if plot_format is None or plot_format['output'] not in ('html', 'data'):
+        return jsonify({"error": "Format parameter must be one of: html, data"}), 400
+
+    # All the charts are rendered from the same dataset, even if it is refreshed meanwhile
+    served = current_dataset()
+
+    # The country's rows are filtered once and shared by the charts built from them
+    try:
+        filtered_data = filter_energy_data(served.data, country, start_year, end_year)
+    except ValueError:
+        filtered_data = None  # each chart reports the missing country itself
+
+    # the stages of the charts rendered by the pool are counted in this request's Server-Timing
+    # (a streamed response has sent its headers before the charts are rendered)
+    stages = current_stages()
+
+    def render(index):
+        try:
+            with stages_of(stages):
+                return {'index': index, 'chart': charts[index].get('chart'), 'result': render_batch_chart(charts[index], country, start_year, end_year, filtered_data, served, **plot_format)}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return {'index': index, 'chart': charts[index].get('chart') if isinstance(charts[index], dict) else None, 'error': str(error)}
+
+    jobs = [plot_executor.submit(render, index) for index in range(len(charts))]
+
+    if body.get('stream'):
+        # one JSON line per chart, as soon as it is rendered
+        def generate():
+            for job in as_completed(jobs):
+                yield json.dumps(job.result(), default=str) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    results = [job.result() for job in jobs]
+    return jsonify({'country': country, 'charts': [result.get('result', {'error': result.get('error')}) for result in results]})
+
+
+@routes.route('/predict_consumption', methods=['GET'])
 def predict_consumption_api():
     country = request.args.get('country')
     year = request.args.get('year', type=int)
@@ -227,14 +428,15 @@ def predict_consumption_api():
         return jsonify({"error": "Energy type parameter is required"}), 400
     
     # return predict_consumption(country, year, energy_type, data_path)
-    prediction_consumption = predict_consumption(country_name = country, prediction_year = year, energy_type = energy_type, csv_file_path = file_path)
+    served = current_dataset()
+    prediction_consumption = predict_consumption(country_name = country, prediction_year = year, energy_type = energy_type, csv_file_path = file_path, data = served.data, dataset_version = served.fingerprint)
     # print(prediction_consumption)
     return jsonify(prediction_consumption)
 
 # List of energy types to predict
 energy_types = [ 'wind', 'solar', 'biofuel', 'hydro', 'renewables', 'gas', 'coal', 'fossil_fuel']
 
-@app.route('/predict_all_consumptions', methods=['GET'])
+@routes.route('/predict_all_consumptions', methods=['GET'])
 def predict_all_consumptions_api():
     country = request.args.get('country')
     year = request.args.get('year', type=int)
@@ -245,82 +447,388 @@ def predict_all_consumptions_api():
     if not year:
         return jsonify({"error": "Year parameter is required"}), 400
 
-    # To store predictions for all energy types
-    predictions = {}
-
-    # Loop through each energy type and get predictions
-    for energy_type in energy_types:
-        prediction = predict_consumption(country_name = country, prediction_year = year, energy_type = energy_type, csv_file_path = file_path)
-        predictions[energy_type] = prediction
+    # Predictions for all energy types, evaluated together in one batched rollout
+    served = current_dataset()
+    predictions = forecast_all_energy_types(country, served.data, energy_types, year, dataset_version=served.fingerprint)
 
     # Return the predictions as a JSON response
     return jsonify(predictions)
 
 
-@app.route('/predict_all_consumptions_for_ten_years', methods=['GET'])
-def predict_all_consumptions_for_ten_years_api():
-    country = request.args.get('country')
-    start_year = 2024
-    data_path = 'owid-energy-data.csv'
-
-    if not country:
-        return jsonify({"error": "Country parameter is required"}), 400
-    if not start_year:
-        return jsonify({"error": "Start year parameter is required"}), 400
-
+def ten_year_predictions(country, start_year, served):
     # To store predictions for all energy types and years
     all_predictions = {}
 
+    # One batched rollout of all energy types up to the last year gives every year on the way
+    end_year = start_year + 9
+    trajectories = forecast_all_energy_types(country, served.data, energy_types, end_year, dataset_version=served.fingerprint)
+
     # Predict for the next 10 years
     for year in range(start_year, start_year + 10):
         yearly_predictions = {}
         for energy_type in energy_types:
-            prediction = predict_consumption(country, year, energy_type, data_path)
+            prediction = trajectories[energy_type]
+            if isinstance(prediction, list):
+                prediction = predictions_up_to_year(prediction, year)
             yearly_predictions[energy_type] = prediction
         
         all_predictions[year] = yearly_predictions
 
+    return all_predictions
+
+
+@routes.route('/predict_all_consumptions_for_ten_years', methods=['GET'])
+def predict_all_consumptions_for_ten_years_api():
+    country = request.args.get('country')
+    start_year = 2024
+    data_path = 'owid-energy-data.csv'
+
+    if not country:
+        return jsonify({"error": "Country parameter is required"}), 400
+    if not start_year:
+        return jsonify({"error": "Start year parameter is required"}), 400
+
+    if request.args.get('async') == '1':
+        # answered right away with a job to poll (GET /jobs/<id>)
+        return submit_forecast_job('ten_years', {'country': country, 'start_year': start_year})
+
     # Return the predictions as a JSON response
-    return jsonify(all_predictions)
+    return jsonify(ten_year_predictions(country, start_year, current_dataset()))
+
+# the work of each kind of forecast job, from its parameters and the dataset snapshot
+forecast_jobs = {
+    'ten_years': lambda params, served: ten_year_predictions(params['country'], params['start_year'], served),
+    'all_consumptions': lambda params, served: forecast_all_energy_types(params['country'], served.data, energy_types, params['year'], dataset_version=served.fingerprint),
+    'consumption': lambda params, served: predict_consumption(country_name = params['country'], prediction_year = params['year'], energy_type = params['energy'], csv_file_path = file_path, data = served.data, dataset_version = served.fingerprint),
+}
+
+def job_response(job):
+    job['poll'] = f"/jobs/{job['id']}"
+    return job
+
+def submit_forecast_job(kind, params):
+    # identical requests on the same dataset share one job (and its stored result)
+    served = current_dataset()
+    job = job_queue.submit(kind, {**params, 'dataset': served.fingerprint}, lambda: forecast_jobs[kind](params, served))
+    return jsonify(job_response(job)), 200 if job['status'] == 'done' else 202
+
+@routes.route('/jobs/forecast', methods=['POST'])
+def submit_forecast_job_api():
+    # {"kind": "ten_years", "country": "Germany"}, {"kind": "all_consumptions", "country": "Germany", "year": 2030}
+    # or {"kind": "consumption", "country": "Germany", "year": 2030, "energy": "wind"}
+    body = request.get_json(silent=True) or {}
+    kind = body.get('kind')
+    if kind not in forecast_jobs:
+        return jsonify({"error": f"Kind parameter must be one of: {', '.join(forecast_jobs)}"}), 400
+    if not body.get('country'):
+        return jsonify({"error": "Country parameter is required"}), 400
 
-@app.route('/get_energy_consumption', methods=['GET'])
+    params = {'country': body['country']}
+    if kind == 'ten_years':
+        params['start_year'] = 2024
+    else:
+        if not isinstance(body.get('year'), int):
+            return jsonify({"error": "Year parameter is required"}), 400
+        params['year'] = body['year']
+    if kind == 'consumption':
+        if not body.get('energy'):
+            return jsonify({"error": "Energy type parameter is required"}), 400
+        params['energy'] = body['energy']
+
+    return submit_forecast_job(kind, params)
+
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def forecast_job_api(job_id):
+    # ?wait=10 answers as soon as the job is finished, or after 10 seconds (at most 60)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 60)
+    job = job_queue.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_response(job))
+
+@routes.route('/jobs/<job_id>/stream', methods=['GET'])
+def forecast_job_stream_api(job_id):
+    # one JSON line per status change, the last one with the result
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def generate():
+        job = job_queue.get(job_id)
+        yield json.dumps(job_response(job), default=str) + '\n'
+        while job['status'] in ('queued', 'running'):
+            status = job['status']
+            job = job_queue.get(job_id, wait=5)
+            if job is None:
+                return
+            if job['status'] != status or job['status'] not in ('queued', 'running'):
+                yield json.dumps(job_response(job), default=str) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@routes.route('/forecast_store_stats', methods=['GET'])
+def forecast_store_stats_api():
+    # hits / misses of the precomputed and the stored forecast trajectories
+    return jsonify({**forecast_store_stats(), 'precomputed': precomputed_stats()})
+
+@routes.route('/job_queue_stats', methods=['GET'])
+def job_queue_stats_api():
+    return jsonify(job_queue.stats())
+
+@routes.route('/model_registry_stats', methods=['GET'])
+def model_registry_stats_api():
+    # hit/miss/load-time counters of the in-process model registry
+    return jsonify(registry_stats())
+
+@routes.route('/response_cache_stats', methods=['GET'])
+def response_cache_stats_api():
+    # hit rate and size of the plot response cache
+    return jsonify(response_cache_stats())
+
+def admin_denied():
+    # ADMIN_TOKEN protects the admin routes: requests must send it in the X-Admin-Token header,
+    # and without a configured token the admin routes are disabled
+    if not admin_token:
+        return jsonify({"error": "The admin routes are disabled (ADMIN_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), admin_token.encode()):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+@routes.route('/dataset_status', methods=['GET'])
+def dataset_status_api():
+    # version / fingerprint of the served dataset and the result of the last refresh
+    return jsonify(dataset_manager.status())
+
+@routes.route('/admin/refresh_dataset', methods=['POST'])
+def refresh_dataset_api():
+    # Downloads the dataset again and swaps it in when it changed, while the current one keeps being served:
+    # {"url": "https://nyc3.digitaloceanspaces.com/owid-public/data/energy/owid-energy-data.csv", "wait": false} (both optional,
+    # the url must be https on a host of DATASET_REFRESH_HOSTS)
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    body = request.get_json(silent=True) or {}
+    if body.get('url') is not None:
+        try:
+            check_refresh_url(str(body['url']), refresh_hosts)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+    if not dataset_manager.refresh(body.get('url'), wait=bool(body.get('wait'))):
+        return jsonify({"error": "A refresh is already running", **dataset_manager.status()}), 409
+    return jsonify(dataset_manager.status()), 200 if body.get('wait') else 202
+
+def profile_denied():
+    # Profiling is only possible with a configured ADMIN_TOKEN: without one the profile routes don't exist (404)
+    if not admin_token:
+        return jsonify({"error": "Profiling is disabled (ADMIN_TOKEN is not set)"}), 404
+    return admin_denied()
+
+@routes.route('/admin/profile', methods=['POST'])
+def start_profile_api():
+    # Profiles the next requests matching a route expression, e.g.
+    # {"mode": "sample", "route": "^/plot_", "requests": 20, "seconds": 60, "interval_ms": 5, "memory": true}
+    # mode: sample (stack samples, low overhead) or cprofile; memory: also compare tracemalloc snapshots
+    denied = profile_denied()
+    if denied:
+        return denied
+
+    body = request.get_json(silent=True) or {}
+    try:
+        started = request_profiler.start(
+            mode=body.get('mode', 'sample'),
+            route=body.get('route'),
+            max_requests=max(int(body.get('requests', 20)), 1),
+            seconds=min(max(float(body.get('seconds', 60)), 1), 3600),
+            interval=min(max(float(body.get('interval_ms', 5)), 1), 1000) / 1000,
+            memory=bool(body.get('memory')),
+        )
+    except (TypeError, ValueError) as error:
+        return jsonify({"error": str(error), "modes": profile_modes}), 400
+    if not started:
+        return jsonify({"error": "A profile is already running", **request_profiler.status()}), 409
+    return jsonify(request_profiler.status()), 202
+
+@routes.route('/admin/profile', methods=['GET'])
+def profile_result_api():
+    # The status of the profile and, once it is done, its top functions and memory diff;
+    # ?format=collapsed returns the collapsed stacks (for flamegraph.pl or speedscope), ?wait=30 waits for it to finish
+    denied = profile_denied()
+    if denied:
+        return denied
+
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 300)
+    if wait:
+        request_profiler.wait(wait)
+    if request.args.get('format') == 'collapsed':
+        return Response(request_profiler.collapsed_stacks(), mimetype='text/plain')
+    return jsonify(request_profiler.result())
+
+@routes.route('/admin/profile', methods=['DELETE'])
+def stop_profile_api():
+    # Ends the running profile now and returns its result
+    denied = profile_denied()
+    if denied:
+        return denied
+
+    request_profiler.stop()
+    return jsonify(request_profiler.result())
+
+@routes.route('/get_energy_consumption', methods=['GET'])
 def api_get_energy_consumption():
     year = request.args.get('year')
-    result = get_energy_consumption(dataset, int(year))
+    result = get_energy_consumption(current_dataset().data, int(year))
     return jsonify(result)
 
-@app.route('/get_energy_consumption_by_year', methods=['GET'])
+@routes.route('/get_energy_consumption_by_year', methods=['GET'])
 def api_get_energy_consumption_by_year():
     year = request.args.get('year')
-    result = get_energy_consumption_by_year(dataset, int(year))
+    result = get_energy_consumption_by_year(current_dataset().data, int(year))
     return jsonify(result)
 
-@app.route('/get_top_renewable_countries_by_year', methods=['GET'])
+@routes.route('/get_top_renewable_countries_by_year', methods=['GET'])
 def api_get_top_renewable_countries_by_year():
     year = request.args.get('year')
-    result = get_top_renewable_countries_by_year(dataset, int(year))
+    result = get_top_renewable_countries_by_year(current_dataset().data, int(year))
     return jsonify(result)
 
-@app.route('/get_renewable_energy_shares_by_year', methods=['GET'])
+@routes.route('/get_renewable_energy_shares_by_year', methods=['GET'])
 def api_get_renewable_energy_shares_by_year():
     year = request.args.get('year')
-    result = get_renewable_energy_shares_by_year(dataset, int(year))
+    result = get_renewable_energy_shares_by_year(current_dataset().data, int(year))
     return jsonify(result)
 
-@app.route('/get_top_fossil_countries_by_year', methods=['GET'])
+@routes.route('/get_top_fossil_countries_by_year', methods=['GET'])
 def api_get_top_fossil_countries_by_year():
     year = request.args.get('year')
-    result = get_top_fossil_countries_by_year(dataset, int(year))
+    result = get_top_fossil_countries_by_year(current_dataset().data, int(year))
     return jsonify(result)
 
-@app.route('/get_energy_consumption_by_type_and_year_for_country', methods=['GET'])
+@routes.route('/get_energy_consumption_by_type_and_year_for_country', methods=['GET'])
 def api_get_energy_consumption_by_type_and_year_for_country():
     country = request.args.get('country')
     year = request.args.get('year')
     energy_type = request.args.get('energy_type')
-    result = get_energy_consumption_by_type_and_year_for_country(dataset, int(year), energy_type, country)
+    result = get_energy_consumption_by_type_and_year_for_country(current_dataset().data, int(year), energy_type, country)
     return jsonify(result)
 
-# Run the Flask app
+@routes.app_errorhandler(DatasetNotLoaded)
+def dataset_not_loaded(error):
+    return jsonify({"error": str(error), **dataset_manager.status()}), 503, {'Retry-After': '5'}
+
+@routes.route('/health', methods=['GET'])
+def health_api():
+    # the worker is up and answering (the dataset may still be loading)
+    return jsonify({"status": "ok"})
+
+@routes.route('/ready', methods=['GET'])
+def ready_api():
+    # 200 once the worker can take traffic (its dataset is loaded and warmed up, or will be loaded by the first
+    # request in lazy mode), 503 until then
+    ready = (dataset_manager.current() is not None and warmup_completed()) or dataset_loading == 'lazy'
+    return jsonify({"ready": ready, "dataset": dataset_manager.status(), "warmup": warmup_status()}), 200 if ready else 503
+
+
+# eager: create_app returns once the dataset is loaded, background: it is loaded in a thread (the data routes
+# answer 503 until then, see /ready), lazy: the first request that needs it loads it
+dataset_loading_modes = ['eager', 'background', 'lazy']
+
+def config_from_environment():
+    # The configuration of the app from the environment variables (see README)
+    return {
+        'DATASET_PATH': file_path,
+        'DATASET_URL': url,
+        # hosts a refresh may be asked to download from (comma-separated, default: the host of DATASET_URL)
+        'DATASET_REFRESH_HOSTS': os.environ.get('DATASET_REFRESH_HOSTS'),
+        # DATASET_SHARED_MEMORY=1 keeps the cache in /dev/shm, so the workers map one copy in RAM
+        'DATASET_CACHE_DIR': shared_memory_cache_dir if os.environ.get('DATASET_SHARED_MEMORY') == '1' else 'dataset_cache',
+        # DATASET_COMPACT=1 loads the smaller compact dataset (served columns only, float32 metrics)
+        'DATASET_COMPACT': os.environ.get('DATASET_COMPACT') == '1',
+        # where the cleaned dataset is also written as CSV when the cache is rebuilt ('' to skip it)
+        'CLEANED_CSV_PATH': os.environ.get('CLEANED_CSV_PATH', 'cleaned_dataset.csv') or None,
+        'DATASET_LOADING': os.environ.get('DATASET_LOADING', 'background'),
+        'PLOT_DPI': int(os.environ['PLOT_DPI']) if os.environ.get('PLOT_DPI') else None,
+        'PLOT_CACHE_DIR': os.environ.get('PLOT_CACHE_DIR'),
+        'PLOT_RENDER_THREADS': int(os.environ.get('PLOT_RENDER_THREADS', 4)),
+        'PRECOMPUTED_FORECASTS': os.environ.get('PRECOMPUTED_FORECASTS'),
+        'FORECAST_STORE': os.environ.get('FORECAST_STORE'),
+        'FORECAST_JOB_WORKERS': int(os.environ.get('FORECAST_JOB_WORKERS', 2)),
+        'ADMIN_TOKEN': os.environ.get('ADMIN_TOKEN'),
+        # models to load and charts to render before the worker is ready ('' to skip the warm-up)
+        'WARMUP_SPEC': os.environ.get('WARMUP_SPEC', 'warmup.json'),
+    }
+
+def create_app(config=None):
+    """
+    Creates the Flask app. A process serves one app: creating another one replaces the dataset manager,
+    pools and settings the handlers use.
+
+    :param config: Overrides of config_from_environment(), e.g. {'DATASET_LOADING': 'eager', 'FORECAST_STORE': ''}.
+    :return: The Flask app (run it with gunicorn "RECT:create_app()", or python RECT.py).
+    """
+    global dataset_manager, dataset_loading, plot_executor, job_queue, admin_token, refresh_hosts
+
+    config = {**config_from_environment(), **(config or {})}
+    if config['DATASET_LOADING'] not in dataset_loading_modes:
+        raise ValueError(f"DATASET_LOADING must be one of: {', '.join(dataset_loading_modes)}")
+
+    # The dataset manager downloads the file if it doesn't exist, and can refresh it later
+    # (POST /admin/refresh_dataset) without a restart: the new dataset is cleaned in the background
+    # and swapped in atomically, with the next version number.
+    # Loading the cleaned dataset: the cleaning runs only when the source file changed,
+    # otherwise the result is memory-mapped from the binary cache in dataset_cache/.
+    dataset_manager = DatasetManager(config['DATASET_PATH'], config['DATASET_URL'], cache_dir=config['DATASET_CACHE_DIR'],
+                                     cleaned_csv_path=config['CLEANED_CSV_PATH'], compact=config['DATASET_COMPACT'])
+    # Country/year row index and yearly rollups used by the handlers, built before a dataset is served
+    dataset_manager.add_prepare_hook(get_dataset_index)
+    dataset_manager.add_prepare_hook(energy_rollups)
+    # responses of the previous dataset are never served again (they are keyed by its fingerprint)
+    dataset_manager.add_swap_listener(lambda served: clear_response_cache())
+    # then the hot models are loaded and the declared charts rendered again (functions/warmup.py), before /ready
+    warmup_spec = load_warmup_spec(config['WARMUP_SPEC'])
+    dataset_manager.add_swap_listener(lambda served: run_warmup(warmup_spec, lambda chart: render_warmup_chart(chart, served)))
+    dataset_loading = config['DATASET_LOADING']
+
+    # Resolution of the rendered plots
+    if config['PLOT_DPI']:
+        configure_rendering(dpi=config['PLOT_DPI'])
+    # Rendered plots are cached per dataset version; PLOT_CACHE_DIR adds a shared on-disk tier
+    configure_response_cache(cache_dir=config['PLOT_CACHE_DIR'])
+    plot_executor = ThreadPoolExecutor(max_workers=config['PLOT_RENDER_THREADS'], thread_name_prefix='plot')
+
+    # Forecasts are answered from the precomputed artifact written after training (PRECOMPUTED_FORECASTS,
+    # saved_models/precomputed_forecasts.npz by default), then from the SQLite store of computed
+    # trajectories (FORECAST_STORE, '' to disable), and only then computed
+    configure_precomputed_forecasts(config['PRECOMPUTED_FORECASTS'])
+    configure_forecast_store(config['FORECAST_STORE'])
+    # Forecasts run as jobs on a small pool of threads, so the web workers stay free for the cheap endpoints
+    job_queue = JobQueue(max_workers=config['FORECAST_JOB_WORKERS'])
+
+    admin_token = config['ADMIN_TOKEN']
+    # a profile started through a previous app doesn't outlive it
+    request_profiler.stop()
+    if config['DATASET_REFRESH_HOSTS'] is not None:
+        refresh_hosts = {host.strip() for host in config['DATASET_REFRESH_HOSTS'].split(',') if host.strip()}
+    else:
+        refresh_hosts = {urllib.parse.urlsplit(config['DATASET_URL']).hostname} - {None}
+
+    add_collector('model_registry', registry_stats, counters=['hits', 'misses', 'load_waits', 'loads', 'numpy_loads', 'load_failures', 'evictions', 'load_seconds'])
+    add_collector('response_cache', response_cache_stats, counters=['hits', 'disk_hits', 'misses', 'evictions', 'render_seconds'])
+    add_collector('forecast_store', forecast_store_stats, counters=['hits', 'misses', 'writes', 'errors'])
+    add_collector('precomputed_forecasts', precomputed_stats, counters=['hits', 'misses', 'stale'])
+    add_collector('job_queue', job_queue.stats, counters=['submitted', 'deduplicated', 'reused', 'completed', 'failed'])
+    add_collector('warmup', warmup_status, counters=['runs'])
+
+    app = Flask(__name__)
+    app.config.update(config)
+    CORS(app)
+    app.register_blueprint(routes)
+
+    if dataset_loading == 'eager':
+        dataset_manager.load()
+    elif dataset_loading == 'background':
+        dataset_manager.load_in_background()
+    return app
+
+# Run the Flask app (the plots are rendered without pyplot, so requests can be served by several threads)
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True, threaded=True)
\ No newline at end of file
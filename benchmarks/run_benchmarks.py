@@ -0,0 +1,246 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+# use the sys path, so the functions package can be imported when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_data import write_synthetic_dataset, write_tiny_model
+
+# Times the hot paths of the server on a synthetic OWID-shaped dataset and tiny stand-in models:
+# the startup cleaning, filter_energy_data, the plot functions, save_plot, the get_energy queries and
+# the predictions at several horizons. Each benchmark reports the p50/p90/p99 of its calls and the
+# peak memory (tracemalloc) of one call; with a baseline, a p50 slower than the baseline by more than
+# the tolerance, and by more than the timer noise (see compare_with_baseline), is a regression and the
+# run exits with status 1.
+#
+#     python benchmarks/run_benchmarks.py                   (compare with benchmarks/baseline.json)
+#     python benchmarks/run_benchmarks.py --save-baseline   (record a new baseline)
+
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+benchmark_country = 'Germany'
+model_energy_types = ['wind', 'solar', 'hydro', 'coal']
+prediction_horizons = [1, 5, 10, 25]
+renewable_sources = ['wind_consumption', 'solar_consumption', 'hydro_consumption', 'biofuel_consumption']
+non_renewable_sources = ['coal_consumption', 'oil_consumption', 'gas_consumption', 'nuclear_consumption', 'fossil_fuel_consumption']
+
+
+def time_calls(function, repeat, warmup):
+    # seconds of each of the repeat calls, after warmup calls that are not counted
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def peak_memory(function):
+    # bytes allocated at the peak of one call (a separate call, so tracing doesn't slow the timed ones)
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(function, repeat, warmup):
+    # the functions under test print their results; that output is not part of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        durations = np.array(time_calls(function, repeat, warmup)) * 1000
+        peak = peak_memory(function)
+    return {
+        'calls': len(durations),
+        'mean_ms': round(float(durations.mean()), 4),
+        'p50_ms': round(float(np.percentile(durations, 50)), 4),
+        'p90_ms': round(float(np.percentile(durations, 90)), 4),
+        'p99_ms': round(float(np.percentile(durations, 99)), 4),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def build_benchmarks(work_dir, csv_path):
+    """
+    Returns the benchmarks as a dict name -> function without arguments, set up on the dataset at csv_path
+    with the tiny models written to work_dir/saved_models.
+    """
+    from functions.load_cleaned_dataset import clean_dataset, load_cleaned_dataset
+    from functions.model_registry import configure_registry, get_model_and_scaler
+    from functions.forecast_store import configure_forecast_store
+    from functions.precomputed_forecasts import configure_precomputed_forecasts
+    from functions.filter_energy_data import filter_energy_data
+    from functions.yearly_rollups import YearlyRollups
+    from functions.plot_renderer import new_figure
+    from functions.save_plot import save_plot
+    from functions.plot_energy_type import plot_energy_type
+    from functions.plot_energy_consumption_pie import plot_energy_consumption_pie
+    from functions.plot_renewable_vs_non import plot_renewable_vs_non
+    from functions.plot_energy_consumption_trend import plot_energy_consumption_trend
+    from functions.plot_energy_consumption_over_time import plot_energy_consumption_over_time
+    from functions.plot_renewable_energy_sources_over_time import plot_renewable_energy_sources_over_time
+    from functions.predict_energy_year import predict_energy_year
+    from functions.predict_consumption import predict_consumption
+    from functions.batched_inference import forecast_all_energy_types
+    from functions import get_energy
+
+    raw = pd.read_csv(csv_path)
+    cache_dir = os.path.join(work_dir, 'dataset_cache')
+    with contextlib.redirect_stdout(io.StringIO()):
+        # the first load builds the binary cache, the benchmark times the following (cached) starts
+        data, _ = load_cleaned_dataset(csv_path, cache_dir, cleaned_csv_path=None)
+
+    models_dir = os.path.join(work_dir, 'saved_models')
+    for seed, energy_type in enumerate(model_energy_types):
+        write_tiny_model(models_dir, benchmark_country, energy_type, data, seed=seed)
+    configure_registry(saved_models_dir=models_dir)
+    # live inference only: no stored or precomputed forecasts answer the predictions
+    configure_forecast_store('')
+    configure_precomputed_forecasts(os.path.join(work_dir, 'no_precomputed_forecasts.npz'))
+    model, scaler = get_model_and_scaler(benchmark_country, 'wind')
+
+    years = sorted(int(year) for year in data['year'].unique())
+    last_year = years[-1]
+    start_year, end_year = years[len(years) // 3], last_year
+    country = benchmark_country
+
+    fig, ax = new_figure('benchmark')
+    ax.plot(years, np.linspace(0, 1, len(years)))
+
+    benchmarks = {
+        'startup.clean_dataset': lambda: clean_dataset(raw),
+        'startup.load_cleaned_dataset_cached': lambda: load_cleaned_dataset(csv_path, cache_dir, cleaned_csv_path=None),
+        'filter_energy_data': lambda: filter_energy_data(data, country, start_year, end_year),
+        'filter_energy_data.columns': lambda: filter_energy_data(data, country, start_year, end_year, columns=['year', 'solar_electricity']),
+        'save_plot': lambda: save_plot(fig),
+        'plot_energy_type': lambda: plot_energy_type(data, country, 'solar_electricity', start_year, end_year),
+        'plot_energy_consumption_pie': lambda: plot_energy_consumption_pie(data, renewable_sources + non_renewable_sources, country, end_year),
+        'plot_renewable_vs_non': lambda: plot_renewable_vs_non(data, country, start_year, end_year),
+        'plot_energy_consumption_trend': lambda: plot_energy_consumption_trend(data, country, start_year, end_year),
+        'plot_energy_consumption_over_time': lambda: plot_energy_consumption_over_time(data, country, start_year, end_year),
+        'plot_renewable_energy_sources_over_time': lambda: plot_renewable_energy_sources_over_time(data, start_year),
+        'plot_energy_type.data': lambda: plot_energy_type(data, country, 'solar_electricity', start_year, end_year, output='data'),
+        # the get_energy queries read the rollups, which are built once per dataset
+        'get_energy.rollups_build': lambda: YearlyRollups(data, get_energy.rollup_columns, top_k=5),
+        'get_energy.get_energy_consumption': lambda: get_energy.get_energy_consumption(data, end_year),
+        'get_energy.get_energy_consumption_by_year': lambda: get_energy.get_energy_consumption_by_year(data, end_year),
+        'get_energy.get_top_renewable_countries_by_year': lambda: get_energy.get_top_renewable_countries_by_year(data, end_year),
+        'get_energy.get_renewable_energy_shares_by_year': lambda: get_energy.get_renewable_energy_shares_by_year(data, end_year),
+        'get_energy.get_top_fossil_countries_by_year': lambda: get_energy.get_top_fossil_countries_by_year(data, end_year),
+        'get_energy.get_energy_consumption_by_type_and_year_for_country':
+            lambda: get_energy.get_energy_consumption_by_type_and_year_for_country(data, end_year, 'wind_consumption', country),
+    }
+    for horizon in prediction_horizons:
+        year = last_year + horizon
+        benchmarks[f"predict_energy_year.h{horizon}"] = lambda year=year: predict_energy_year(model, scaler, data, country, year, 5, 'wind')
+        benchmarks[f"predict_consumption.h{horizon}"] = lambda year=year: predict_consumption(country, year, 'wind', None, data=data)
+    benchmarks['forecast_all_energy_types.h10'] = lambda: forecast_all_energy_types(country, data, model_energy_types, last_year + 10)
+    return benchmarks
+
+
+def compare_with_baseline(results, baseline, tolerance, min_delta_ms=1.0, noise_spreads=3.0):
+    """
+    :return: The names of the benchmarks whose p50 is more than tolerance (relative) slower than in the baseline,
+             and also more than min_delta_ms and noise_spreads times the p90 - p50 spread of the baseline slower:
+             a sub-millisecond query doubling its p50 is within the jitter of the timer and the scheduler.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+        margin = max(min_delta_ms, noise_spreads * (reference['p90_ms'] - reference['p50_ms']))
+        if result['p50_ms'] > max(reference['p50_ms'] * (1 + tolerance), reference['p50_ms'] + margin):
+            regressions.append(name)
+    return regressions
+
+
+def print_report(results, baseline=None, regressions=()):
+    reference = (baseline or {}).get('results', {})
+    print(f"{'benchmark':<66}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak KB':>11}{'vs base':>9}")
+    for name, result in results.items():
+        change = ''
+        if name in reference and reference[name]['p50_ms'] > 0:
+            change = f"{result['p50_ms'] / reference[name]['p50_ms'] - 1:+.0%}"
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<66}{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['peak_kb']:>11.1f}{change:>9}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dataset, plotting and prediction hot paths.')
+    parser.add_argument('--countries', type=int, default=60)
+    parser.add_argument('--years', type=int, default=60)
+    parser.add_argument('--extra-columns', type=int, default=0, help='additional columns in the synthetic dataset')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per benchmark')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', nargs='*', help='run the benchmarks whose name starts with one of these')
+    parser.add_argument('--baseline', default=baseline_path)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed p50 slowdown against the baseline (0.5 = 50%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='a regression is also at least this much slower')
+    parser.add_argument('--noise-spreads', type=float, default=3.0,
+                        help='a regression is also slower by this many times the p90 - p50 spread of the baseline')
+    parser.add_argument('--output', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    config = {'countries': args.countries, 'years': args.years, 'extra_columns': args.extra_columns, 'repeat': args.repeat}
+    work_dir = tempfile.mkdtemp(prefix='rect-benchmarks-')
+    try:
+        csv_path = write_synthetic_dataset(os.path.join(work_dir, 'owid-energy-data.csv'), countries=args.countries,
+                                           years=args.years, extra_columns=args.extra_columns)
+        benchmarks = build_benchmarks(work_dir, csv_path)
+        if args.only:
+            benchmarks = {name: function for name, function in benchmarks.items() if name.startswith(tuple(args.only))}
+
+        results = {}
+        for name, function in benchmarks.items():
+            results[name] = run_benchmark(function, args.repeat, args.warmup)
+            print(f"{name}: p50 {results[name]['p50_ms']:.3f} ms", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'config': config, 'python': platform.python_version(), 'machine': platform.machine(),
+              'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print_report(results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"Warning: the baseline was recorded with {baseline.get('config')}, this run uses {config}")
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.min_delta_ms, args.noise_spreads) if baseline else []
+    print_report(results, baseline, regressions)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline p50: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
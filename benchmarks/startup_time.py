@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+# use the sys path, so the benchmarks package can be imported when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_data import write_synthetic_dataset
+
+# Measures how fast a new worker starts: importing RECT, create_app, the first /health answer and the
+# first /get_* answer (the dataset loaded from its binary cache, in the background), each in a fresh
+# interpreter. The run fails (status 1) when the median of a step is over its budget, or when a heavy
+# module that should only be imported on demand (matplotlib, TensorFlow, sklearn) was loaded.
+#
+#     python benchmarks/startup_time.py
+#     python benchmarks/startup_time.py --csv owid-energy-data.csv --runs 10 --show-imports 15
+
+repository_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# modules the server must not import to answer /health and /get_*
+lazy_modules = ['matplotlib', 'tensorflow', 'keras', 'sklearn']
+
+# runs in a fresh interpreter; prints the timings (seconds since the interpreter started importing RECT) as JSON
+startup_script = '''
+import sys, json, time
+started = time.perf_counter()
+import RECT
+imported = time.perf_counter()
+app = RECT.create_app(json.loads(sys.argv[1]))
+created = time.perf_counter()
+client = app.test_client()
+client.get('/health')
+health = time.perf_counter()
+while client.get('/get_energy_consumption_by_year?year=2000').status_code == 503:
+    time.sleep(0.005)
+first_get = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - started,
+    'health': health - started,
+    'first_get': first_get - started,
+    'lazy_modules_loaded': [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+'''
+
+
+def measure_startup(config, import_times=False):
+    """
+    Starts a worker in a new interpreter.
+
+    :return: (timings, stderr): the timings printed by startup_script, and its stderr (the -X importtime report if asked for).
+    """
+    command = [sys.executable] + (['-X', 'importtime'] if import_times else []) + ['-c', startup_script, json.dumps(config), json.dumps(lazy_modules)]
+    completed = subprocess.run(command, cwd=repository_dir, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def slowest_imports(importtime_report, count):
+    # the modules imported by RECT itself with the largest cumulative time, from the output of python -X importtime
+    imports = []
+    for line in importtime_report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # the name is indented by two spaces per level of nesting, RECT's own imports are on the first level
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the startup time of a worker against a budget.')
+    parser.add_argument('--csv', default=None, help='dataset to load (default: a synthetic OWID-shaped dataset)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--import-budget', type=float, default=1.0, help='seconds to import RECT and create the app')
+    parser.add_argument('--ready-budget', type=float, default=1.0, help='seconds until the first /get_* answer')
+    parser.add_argument('--show-imports', type=int, default=10, help='list the slowest imports of RECT')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='rect-startup-')
+    try:
+        csv_path = os.path.abspath(args.csv) if args.csv else write_synthetic_dataset(os.path.join(work_dir, 'owid-energy-data.csv'))
+        # without the warm-up, which renders charts (importing matplotlib) once the dataset is loaded
+        config = {'DATASET_PATH': csv_path, 'DATASET_CACHE_DIR': os.path.join(work_dir, 'dataset_cache'),
+                  'CLEANED_CSV_PATH': '', 'DATASET_LOADING': 'background', 'FORECAST_STORE': '', 'WARMUP_SPEC': ''}
+
+        # the first start builds the binary cache of the dataset; a worker normally finds it already built
+        measure_startup(config)
+        runs = [measure_startup(config)[0] for _ in range(args.runs)]
+        _, importtime_report = measure_startup(config, import_times=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    medians = {step: float(np.median([run[step] for run in runs])) for step in ('import', 'create_app', 'health', 'first_get')}
+    for step, seconds in medians.items():
+        print(f"{step:<12}{seconds * 1000:>9.1f} ms (median of {len(runs)})")
+    print("\nslowest imports of RECT:")
+    for seconds, name in slowest_imports(importtime_report, args.show_imports):
+        print(f"  {name:<40}{seconds * 1000:>9.1f} ms")
+
+    failures = []
+    if medians['create_app'] > args.import_budget:
+        failures.append(f"import + create_app took {medians['create_app']:.3f} s (budget {args.import_budget} s)")
+    if medians['first_get'] > args.ready_budget:
+        failures.append(f"the first /get_* answer took {medians['first_get']:.3f} s (budget {args.ready_budget} s)")
+    loaded = sorted({name for run in runs for name in run['lazy_modules_loaded']})
+    if loaded:
+        failures.append(f"modules that should be imported on demand were loaded at startup: {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
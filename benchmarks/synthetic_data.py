@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+# use the sys path, so the functions package and cols_to_check can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cols_to_check import features, served_features
+from functions.lstm_numpy import weight_names, save_numpy_model
+from functions.model_registry import model_paths
+
+# A dataset shaped like the OWID energy file (same columns, aggregate regions included, missing
+# values in the early years) and tiny LSTM models in the saved_models/ layout, so the benchmarks
+# run anywhere, without the real download or a trained model.
+
+# aggregate regions first, like in the OWID file; the rest are named 'Country 001', ...
+named_countries = ['World', 'Asia', 'Europe', 'High-income countries', 'Germany', 'France']
+aggregate_countries = {'World', 'Asia', 'Europe', 'High-income countries'}
+
+
+def country_names(count):
+    names = named_countries[:count]
+    return names + [f"Country {number:03d}" for number in range(1, count - len(names) + 1)]
+
+
+def generate_owid_dataset(countries=50, years=60, extra_columns=0, last_year=2023, seed=0):
+    """
+    Returns a random DataFrame with the columns of the OWID energy file.
+
+    :param countries: Number of countries (the first ones are the aggregate regions, Germany and France).
+    :param years: Number of years per country, up to last_year.
+    :param extra_columns: Additional numeric columns, to grow the width of the file.
+    """
+    rng = np.random.default_rng(seed)
+    names = country_names(countries)
+    year_values = np.arange(last_year - years + 1, last_year + 1)
+
+    metric_columns = [column for column in features + served_features if column not in ('country', 'year')]
+    metric_columns = list(dict.fromkeys(metric_columns)) + [f"extra_{number}" for number in range(extra_columns)]
+
+    rows = len(names) * len(year_values)
+    growth = np.tile((year_values - year_values[0] + 1) / len(year_values), len(names))
+    metrics = np.abs(rng.normal(100, 30, size=(rows, len(metric_columns)))) * growth[:, None]
+    # like the real file, a part of the early values is missing
+    early = np.tile(year_values < year_values[0] + len(year_values) // 4, len(names))
+    metrics[early[:, None] & (rng.random((rows, len(metric_columns))) < 0.5)] = np.nan
+
+    country_column = np.repeat(names, len(year_values))
+    data = pd.DataFrame({
+        'country': country_column,
+        'year': np.tile(year_values, len(names)),
+        'iso_code': [None if name in aggregate_countries else name[:3].upper() for name in country_column],
+        'population': 1e6,
+        'gdp': 1e9,
+    })
+    return pd.concat([data, pd.DataFrame(metrics, columns=metric_columns)], axis=1)
+
+
+def write_synthetic_dataset(path, **options):
+    generate_owid_dataset(**options).to_csv(path, index=False)
+    return path
+
+
+def write_tiny_model(models_dir, country, energy_type, data, units=8, seed=0):
+    """
+    Writes a random LSTM(units) -> Dense(1) model of a country and energy type as the .npz export
+    the model registry serves (no .h5, TensorFlow is not needed), scaled on the country's series.
+    """
+    rng = np.random.default_rng(seed)
+    shapes = {
+        'kernel': (1, 4 * units),
+        'recurrent_kernel': (units, 4 * units),
+        'bias': (4 * units,),
+        'dense_kernel': (units, 1),
+        'dense_bias': (1,),
+    }
+    lstm_weights = {name: rng.normal(0, 0.3, size=shapes[name]).astype(np.float32) for name in weight_names}
+
+    series = data.loc[data['country'] == country, energy_type + '_consumption'].fillna(0).to_numpy(dtype=float)
+    scaler = MinMaxScaler().fit(np.array([[series.min()], [series.max()]]))
+
+    model_path, _ = model_paths(country, energy_type, models_dir)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    save_numpy_model(os.path.splitext(model_path)[0] + '.npz', lstm_weights, scaler)
@@ -87,6 +87,15 @@ features = ['year',
                         'fossil_share_energy',
 ]
 
+# Columns the plot and /get_* functions read besides the features
+served_features = [
+    'oil_consumption',
+    'oil_share_elec',
+    'nuclear_consumption',
+    'nuclear_share_elec',
+    'primary_energy_consumption',
+    ]
+
 additional_features = [
     'year',
     'country',
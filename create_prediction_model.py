@@ -1,73 +1,232 @@
-import numpy as np
-import tensorflow as tf
 import os
-import matplotlib.pyplot as plt
-import joblib
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 
-from functions.load_and_process_data import load_and_preprocess_data
+import pandas as pd
+from matplotlib.figure import Figure
+
+from functions.load_and_process_data import preprocess_data
 from functions.create_sequences import create_sequences
-from functions.create_lstm_model import build_lstm_model
-from functions.create_lstm_model import train_model
-from functions.create_lstm_model import save_model_and_scaler
-from functions.create_lstm_model import load_model_and_scaler
+from functions.model_registry import model_paths
+from functions.lstm_numpy import save_numpy_model
+from functions.series_fingerprint import series_fingerprint, series_changed, write_fingerprint
+
+# Trains one LSTM model per (country, energy_type) and saves it to saved_models/<country>/<energy>/.
+# The models are trained in parallel by a pool of worker processes; the dataset is parsed once
+# and handed to every worker when it starts. Run with:
+#     python create_prediction_model.py --workers 4
+#     python create_prediction_model.py --all-countries
+#     python create_prediction_model.py --incremental --warm-start   (after a new release of the dataset)
+#     python create_prediction_model.py --precompute-until 2035      (then precompute the forecasts)
+
+countries = [ 'Germany', 'France', 'Asia']
+energy_types = [ 'wind', 'solar', 'biofuel', 'hydro', 'renewables', 'gas', 'coal', 'fossil_fuel']
 
-from functions.predict_energy_year import predict_energy_year
 
-def create_country_energy_type_model( country_name, energy_type, csv_file_path='owid-energy-data.csv', sequence_length = 5):
+def save_training_history_plot(history, title, plot_path):
+    # Figure + Agg canvas instead of pyplot, so nothing is shown and nothing is shared between models
+    fig = Figure(figsize=(8, 5))
+    ax = fig.subplots()
+    ax.plot(history.history['loss'], label='Training Loss')
+    ax.plot(history.history['val_loss'], label='Validation Loss')
+    ax.set_title('Model Training History ' + title)
+    ax.set_ylabel('Loss')
+    ax.set_xlabel('Epoch')
+    ax.legend()
+    os.makedirs(os.path.dirname(plot_path), exist_ok=True)
+    fig.savefig(plot_path, bbox_inches='tight')
 
-    # Load and Preprocess Data
-    energy_data = load_and_preprocess_data(csv_file_path, (energy_type+'_consumption'))
+
+def create_country_energy_type_model( country_name, energy_type, csv_file_path='owid-energy-data.csv', sequence_length = 5,
+                                      energy_data=None, models_dir='saved_models', plots_dir='training_plots', epochs=50,
+                                      warm_start=False):
+
+    from functions.create_lstm_model import build_lstm_model, train_model, save_model_and_scaler, load_model_and_scaler
+    from functions.lstm_numpy import lstm_weights_from_keras
+
+    started = time.perf_counter()
+    record = {'country': country_name, 'energy_type': energy_type}
+
+    # Load and Preprocess Data, unless the pipeline already did it once for all models
+    if energy_data is None:
+        from functions.load_and_process_data import load_and_preprocess_data
+        energy_data = load_and_preprocess_data(csv_file_path, (energy_type+'_consumption'))
     if energy_data is None:
-        exit()
+        return {**record, 'status': 'error', 'error': f"Could not load {csv_file_path}"}
 
     X_train, y_train, scaler = create_sequences(energy_data, country_name, sequence_length, energy_type+'_consumption')
 
     if X_train is None:
-        return (f"Could not create training data for {country_name}. Check if data exists and sequence length is appropriate.")
-    
-    # print(X_train)
-    # print(y_train)
-
-    # Build the lstm model
-    model = build_lstm_model(lstm_units = 50, sequence_length = 5)
-    
+        return {**record, 'status': 'skipped', 'error': f"Could not create training data for {country_name}. Check if data exists and sequence length is appropriate."}
+
+    model_save_path, scaler_save_path = model_paths(country_name, energy_type, models_dir)
+
+    # Build the lstm model, or continue from the weights of the existing one
+    model = build_lstm_model(lstm_units = 50, sequence_length = sequence_length)
+    if warm_start and os.path.exists(model_save_path):
+        # copy the weights into the freshly compiled model rather than reusing the saved optimizer state
+        existing_model, _ = load_model_and_scaler(model_save_path, scaler_save_path)
+        if existing_model is not None:
+            model.set_weights(existing_model.get_weights())
+        record['warm_start'] = existing_model is not None
+
     # Train the LSTM Model
-    print(f"Training LSTM model for {country_name}...")
-    history = train_model(model, X_train, y_train)
-
-    # Plotting training history
-    plt.plot(history.history['loss'], label='Training Loss')
-    plt.plot(history.history['val_loss'], label='Validation Loss')
-    plt.title('Model Training History ' + country_name + ' ' + energy_type+'_consumption')
-    plt.ylabel('Loss')
-    plt.xlabel('Epoch')
-    plt.legend()
-    plt.show()
-    
-    model_save_path = os.path.join("saved_models", country_name, energy_type, f"{country_name}_{energy_type}_consumption.h5")
-    scaler_save_path = os.path.join("saved_models", country_name, energy_type, f"{country_name}_{energy_type}_consumption_scaler.pkl")
+    print(f"Training LSTM model for {country_name} {energy_type}...")
+    history = train_model(model, X_train, y_train, epochs=epochs)
+
+    # Plotting training history to a file
+    plot_path = os.path.join(plots_dir, country_name, f"{country_name}_{energy_type}_consumption_history.png")
+    save_training_history_plot(history, country_name + ' ' + energy_type+'_consumption', plot_path)
+
+    os.makedirs(os.path.dirname(model_save_path), exist_ok=True)
     save_model_and_scaler(model, scaler, model_save_path, scaler_save_path)
+    # NumPy export, so the server can use the new model without TensorFlow
+    save_numpy_model(os.path.splitext(model_save_path)[0] + '.npz', lstm_weights_from_keras(model), scaler, source_path=model_save_path)
+    # Fingerprint of the training series, for --incremental retraining
+    fingerprint = series_fingerprint(energy_data, country_name, energy_type+'_consumption', sequence_length)
+    write_fingerprint(model_save_path, fingerprint, samples=int(len(X_train)), trained_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    return {
+        **record,
+        'status': 'trained',
+        'samples': int(len(X_train)),
+        'epochs': len(history.history['loss']),
+        'loss': float(history.history['loss'][-1]),
+        'val_loss': float(history.history['val_loss'][-1]),
+        'model_path': model_save_path,
+        'scaler_path': scaler_save_path,
+        'plot_path': plot_path,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+# The dataset of a worker process, set once by _init_worker
+_worker_data = None
+
+
+def _init_worker(energy_data, threads_per_worker):
+    global _worker_data
+    _worker_data = energy_data
 
-    # Save Model and Scaler
-    # save_model_and_scaler(model, scaler, model_save_path=((country_name + '_' + energy_type+'_consumption')+'.h5'), scaler_save_path=(country_name + '_' + energy_type+'_consumption_scaler.pkl'))
+    # Limit TensorFlow in each worker, otherwise every process tries to use all the cores
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
 
+
+def _train_job(country_name, energy_type, options):
+    try:
+        return create_country_energy_type_model(country_name, energy_type, energy_data=_worker_data, **options)
+    except Exception as error:  # one failing model shouldn't stop the rest of the pipeline
+        return {'country': country_name, 'energy_type': energy_type, 'status': 'error', 'error': repr(error)}
+
+
+def load_training_data(csv_file_path, energy_types):
+    # Parse the CSV once and prepare the target columns of every energy type
+    print('status: load_and_preprocess_data...' )
+    data = pd.read_csv(csv_file_path)
+    return preprocess_data(data, [energy_type + '_consumption' for energy_type in energy_types])
+
+
+def select_changed_models(energy_data, countries, energy_types, models_dir='saved_models', sequence_length=5):
+    # The (country, energy_type) pairs whose training series differs from the fingerprint saved with the model
+    changed, unchanged = [], []
+    for country in countries:
+        for energy_type in energy_types:
+            model_path, scaler_path = model_paths(country, energy_type, models_dir)
+            if series_changed(energy_data, country, energy_type + '_consumption', sequence_length, model_path, scaler_path):
+                changed.append((country, energy_type))
+            else:
+                unchanged.append((country, energy_type))
+    return changed, unchanged
+
+
+def train_models(energy_data, countries, energy_types, workers=None, threads_per_worker=1, incremental=False, **options):
+    """
+    Trains a model for every (country, energy_type) pair in a pool of worker processes.
+
+    :param energy_data: The preprocessed dataset, shared with the workers when they start.
+    :param incremental: Only train the models whose training series changed since they were last trained.
+    :param options: Passed on to create_country_energy_type_model (models_dir, plots_dir, sequence_length, epochs, warm_start).
+    :return: A list with one manifest record per model.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    records = []
+
+    pairs = [(country, energy_type) for country in countries for energy_type in energy_types]
+    if incremental:
+        pairs, unchanged = select_changed_models(energy_data, countries, energy_types, options.get('models_dir', 'saved_models'),
+                                                 options.get('sequence_length', 5))
+        records += [{'country': country, 'energy_type': energy_type, 'status': 'unchanged'} for country, energy_type in unchanged]
+        print(f"{len(pairs)} models to retrain, {len(unchanged)} unchanged")
+        if not pairs:
+            return sorted(records, key=lambda record: (record['country'], record['energy_type']))
+
+    # spawn: TensorFlow isn't fork-safe once it has been initialized
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(energy_data, threads_per_worker)) as executor:
+        jobs = [executor.submit(_train_job, country, energy_type, options) for country, energy_type in pairs]
+        for job in as_completed(jobs):
+            record = job.result()
+            print(f"{record['country']}/{record['energy_type']}: {record['status']} {record.get('seconds', '')}")
+            records.append(record)
+
+    return sorted(records, key=lambda record: (record['country'], record['energy_type']))
+
+
+def write_manifest(records, manifest_path, **details):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump({**details, 'models': records}, f, indent=2)
+    print(f"Manifest saved to {manifest_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the LSTM consumption models.')
+    parser.add_argument('--csv', default='owid-energy-data.csv')
+    parser.add_argument('--countries', nargs='+', default=countries)
+    parser.add_argument('--all-countries', action='store_true', help='train every country in the dataset')
+    parser.add_argument('--energy-types', nargs='+', default=energy_types)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--sequence-length', type=int, default=5)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--models-dir', default='saved_models')
+    parser.add_argument('--plots-dir', default='training_plots')
+    parser.add_argument('--manifest', default=None, help='defaults to <models-dir>/training_manifest.json')
+    parser.add_argument('--incremental', action='store_true', help='only retrain models whose training series changed')
+    parser.add_argument('--warm-start', action='store_true', help='continue training from the existing model weights')
+    parser.add_argument('--precompute-until', type=int, default=None,
+                        help='then precompute the forecasts of all saved models up to this year (functions/precomputed_forecasts.py)')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    energy_data = load_training_data(args.csv, args.energy_types)
+    selected_countries = sorted(energy_data['country'].unique()) if args.all_countries else args.countries
+
+    records = train_models(energy_data, selected_countries, args.energy_types, workers=args.workers,
+                           threads_per_worker=args.threads_per_worker, models_dir=args.models_dir,
+                           plots_dir=args.plots_dir, sequence_length=args.sequence_length, epochs=args.epochs,
+                           incremental=args.incremental, warm_start=args.warm_start)
+
+    write_manifest(records, args.manifest or os.path.join(args.models_dir, 'training_manifest.json'),
+                   source=args.csv, sequence_length=args.sequence_length,
+                   seconds=round(time.perf_counter() - started, 3))
     print("\n--- Model Training and Saving Complete ---")
 
+    if args.precompute_until is not None:
+        # roll the new models forward once, so RECT serves their forecasts without running them
+        from functions.precomputed_forecasts import main as precompute_main
+        precompute_main(['--until', str(args.precompute_until), '--csv', args.csv, '--models-dir', args.models_dir,
+                         '--sequence-length', str(args.sequence_length)])
+    return records
 
-    # # Load Model and Scaler
-    # loaded_model, loaded_scaler = load_model_and_scaler((country_name + '_' + energy_type+'_consumption')+'.h5', country_name + '_' + energy_type+'_consumption_scaler.pkl')
-    # if loaded_model is None or loaded_scaler is None:
-    #     return 'No model found'
-    
-    # # Predict for a Specific Year
-    # prediction_year = 2030
-    # predicted_wind_2028 = predict_energy_year(loaded_model, loaded_scaler, energy_data, country_name, prediction_year, sequence_length, energy_type)
-    # print(predicted_wind_2028)
 
-# create_country_energy_type_model(sequence_length = 5, country_name = 'Germany', energy_type='wind')
-# 
-countries = [ 'Germany', 'France', 'Asia']
-energy_types = [ 'wind', 'solar', 'biofuel', 'hydro', 'renewables', 'gas', 'coal', 'fossil_fuel']
-for country in countries:
-    for energy_type in energy_types:
-        create_country_energy_type_model(country_name=country, energy_type=energy_type , sequence_length=5)
\ No newline at end of file
+if __name__ == '__main__':
+    records = main()
+    sys.exit(1 if any(record['status'] == 'error' for record in records) else 0)
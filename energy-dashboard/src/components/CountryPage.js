@@ -93,44 +93,69 @@ const CountryPage = () => {
     try {
       // console.log("Fetching Data for:", countryName);
 
-      const urls = [
+      // All charts of the page come from one /plot_batch request
+      const charts = [
         {
-          url: `http://localhost:5000/plot_energy_type?country=${countryName}&energy_type=solar_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "solar_electricity",
           type: "line",
           title: "Solar Electricity",
           lineName: "Solar Capacity",
         },
         {
-          url: `http://localhost:5000/plot_energy_type?country=${countryName}&energy_type=wind_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "wind_electricity",
           type: "line",
           title: "Wind Electricity",
           lineName: "Wind Capacity",
         },
         {
-          url: `http://localhost:5000/plot_energy_type?country=${countryName}&energy_type=hydro_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "hydro_electricity",
           type: "line",
           title: "Hydro Electricity",
           lineName: "Hydro Capacity",
         },
         {
-          url: `http://localhost:5000/plot_renewable_vs_non?country=${countryName}&&start_year=2000&end_year=2023`,
+          chart: "renewable_vs_non",
           type: "line",
           title: "Renewable vs Non-Renewable Energy",
         },
         {
-          url: `http://localhost:5000/plot_energy_consumption_pie?country=${countryName}&year=2023&energy_type=renewable`,
+          chart: "energy_consumption_pie",
+          year: 2023,
+          energy_type: "renewable",
           type: "pie",
           title: "Energy Sources Breakdown",
         },
       ];
 
-      const responses = await Promise.all(urls.map(({ url }) => fetch(url)));
-      const jsonData = await Promise.all(responses.map((res) => res.json()));
+      const response = await fetch("http://localhost:5000/plot_batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          country: countryName,
+          start_year: 2000,
+          end_year: 2023,
+          // the charts are drawn from the data, the server doesn't need to render images
+          format: "data",
+          charts: charts.map(({ chart, energy_type, year }) => ({
+            chart,
+            energy_type,
+            year,
+          })),
+        }),
+      });
+      const jsonData = (await response.json()).charts;
 
       const formattedData = jsonData
         .map((data, index) => {
-          const { type, title, lineName } = urls[index];
+          const { type, title, lineName } = charts[index];
           // console.log(data);
+          if (!data || !data.data) {
+            // this chart failed on the server, e.g. no data for the country
+            return null;
+          }
           if (type === "line") {
             if (data.data.renewable_energy && data.data.non_renewable_energy) {
               // For line charts that have renewable and non-renewable energy
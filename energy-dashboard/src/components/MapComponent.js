@@ -75,38 +75,58 @@ const MapComponent = () => {
       // Fetch basic graphs data
       const apiEndpoints = [
         {
-          url: `http://localhost:5000/plot_energy_type?country=World&energy_type=solar_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "solar_electricity",
           type: "line",
           title: "Solar Electricity",
           lineName: "Solar Capacity",
         },
         {
-          url: `http://localhost:5000/plot_energy_type?country=World&energy_type=wind_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "wind_electricity",
           type: "line",
           title: "Wind Electricity",
           lineName: "Wind Capacity",
         },
         {
-          url: `http://localhost:5000/plot_energy_type?country=World&energy_type=hydro_electricity&start_year=2000&end_year=2023`,
+          chart: "energy_type",
+          energy_type: "hydro_electricity",
           type: "line",
           title: "Hydro Electricity",
           lineName: "Hydro Capacity",
         },
         {
-          url: `http://localhost:5000/plot_renewable_vs_non?country=World&&start_year=2000&end_year=2023`,
+          chart: "renewable_vs_non",
           type: "line",
           title: "Renewable vs Non-Renewable Energy",
         },
       ];
 
-      const responses = await Promise.all(
-        apiEndpoints.map(({ url }) => fetch(url))
-      );
-      const jsonData = await Promise.all(responses.map((res) => res.json()));
+      // One /plot_batch request for all the World charts
+      const batch = await fetchData("http://localhost:5000/plot_batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          country: "World",
+          start_year: 2000,
+          end_year: 2023,
+          // the charts are drawn from the data, the server doesn't need to render images
+          format: "data",
+          charts: apiEndpoints.map(({ chart, energy_type }) => ({
+            chart,
+            energy_type,
+          })),
+        }),
+      });
+      const jsonData = batch?.charts || [];
       const formattedData = jsonData
         .map((data, index) => {
           const { type, title, lineName } = apiEndpoints[index];
           // console.log(data);
+          if (!data || !data.data) {
+            // this chart failed on the server
+            return null;
+          }
           if (type === "line") {
             if (data.data.renewable_energy && data.data.non_renewable_energy) {
               // For line charts that have renewable and non-renewable energy
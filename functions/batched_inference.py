@@ -0,0 +1,102 @@
+import numpy as np
+
+from functions.model_registry import get_model_and_scaler, model_version, get_derived
+from functions.forecast_store import save_forecast
+from functions.precomputed_forecasts import known_forecast
+from functions.dataset_index import country_rows
+from functions.lstm_numpy import lstm_weights_from_keras, stack_lstm_weights, lstm_forward
+from functions.metrics import stage
+
+# Forecasts all energy types of a country together: the per-energy models share the
+# architecture of build_lstm_model, so their weights are stacked and every year of the
+# rollout is one grouped forward pass instead of one model call per energy type.
+
+
+def _stacked_weights(country, energy_types, models):
+    # kept by the model registry with the models they were stacked from (and in its byte budget),
+    # rebuilt once one of them is evicted or reloaded
+    def build():
+        # models served from an .npz export already carry their weights as NumPy arrays
+        stacked = stack_lstm_weights([getattr(model, 'lstm_weights', None) or lstm_weights_from_keras(model) for model in models])
+        return stacked, sum(weights.nbytes for weights in stacked.values())
+
+    keys = [(country, energy_type) for energy_type in energy_types]
+    return get_derived(('stacked', country, tuple(energy_types)), keys, models, build)
+
+
+def forecast_all_energy_types(country, data, energy_types, prediction_year, sequence_length=5, dataset_version=None):
+    """
+    Predicts every energy type of a country from its last known year up to prediction_year.
+
+    :param country: The country (or region) the models were trained for.
+    :param data: The cleaned dataset.
+    :param energy_types: Energy types to predict, e.g. ['wind', 'solar'].
+    :param prediction_year: The last year to predict.
+    :param dataset_version: Version of data; when given, trajectories are read from the precomputed forecasts or
+                            the forecast store, and the computed ones are saved to the store.
+    :return: A dictionary energy_type -> list of yearly predictions (as returned by predict_energy_year),
+             'No model found' if the energy type has no saved model, or None if there isn't enough history.
+    """
+    results = {}
+    country_data = country_rows(data, country)
+
+    versions = {}
+    batched_types, models, scalers = [], [], []
+    for energy_type in energy_types:
+        if dataset_version is not None:
+            versions[energy_type] = model_version(country, energy_type)
+            stored = known_forecast(country, energy_type, versions[energy_type], dataset_version, prediction_year, sequence_length)
+            if stored is not None:
+                results[energy_type] = stored
+                continue
+
+        model, scaler = get_model_and_scaler(country, energy_type)
+        if model is None or scaler is None:
+            results[energy_type] = 'No model found'
+            continue
+        batched_types.append(energy_type)
+        models.append(model)
+        scalers.append(scaler)
+
+    if not batched_types:
+        return {energy_type: results[energy_type] for energy_type in energy_types}
+
+    if country_data.empty:
+        print(f"Error: Not enough historical data for {country} to make a prediction.")
+        return {**results, **{energy_type: None for energy_type in batched_types}}
+
+    last_known_year = int(country_data['year'].iloc[-1])
+    years = range(last_known_year + 1, prediction_year + 1)
+    if len(years) == 0:
+        return {**results, **{energy_type: [] for energy_type in batched_types}}
+
+    if len(country_data) < sequence_length:
+        print(f"Error: Not enough historical data for {country} before {last_known_year + 1} to make a prediction.")
+        return {**results, **{energy_type: None for energy_type in batched_types}}
+
+    target_columns = [energy_type + '_consumption' for energy_type in batched_types]
+    # (groups, sequence_length) window of each energy type, scaled like MinMaxScaler.transform
+    scale = np.array([scaler.scale_[0] for scaler in scalers])
+    offset = np.array([scaler.min_[0] for scaler in scalers])
+    history = country_data[target_columns].to_numpy(dtype=float)[-sequence_length:].T
+    window = history * scale[:, None] + offset[:, None]
+
+    with stage('predict'):
+        stacked = _stacked_weights(country, batched_types, models)
+        predicted = np.empty((len(batched_types), len(years)))
+
+        for step in range(len(years)):
+            # one grouped forward pass for all energy types: (groups, batch=1, sequence_length, 1)
+            predicted_scaled = lstm_forward(stacked, window[:, None, :, None])[:, 0, 0].astype(float)
+            predicted[:, step] = (predicted_scaled - offset) / scale
+            window = np.concatenate([window[:, 1:], (predicted[:, step] * scale + offset)[:, None]], axis=1)
+
+    for group, (energy_type, target_column) in enumerate(zip(batched_types, target_columns)):
+        results[energy_type] = [
+            {'country': country, 'year': year, 'energy_type': target_column, 'prediction': float(predicted[group, step])}
+            for step, year in enumerate(years)
+        ]
+        if dataset_version is not None:
+            save_forecast(country, energy_type, versions[energy_type], dataset_version, results[energy_type], sequence_length)
+
+    return {energy_type: results[energy_type] for energy_type in energy_types}
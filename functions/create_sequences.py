@@ -1,23 +1,67 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.model_selection import train_test_split
 
+from functions.dataset_index import country_rows
+
+# Training windows are views into the scaled series (numpy stride tricks), built for many
+# countries and target columns at once: each country's rows are found once through the dataset
+# index, all its target columns are scaled together, and no window is copied.
+
+
+def _fit_scaler(data_min, data_max):
+    # A MinMaxScaler fitted on the two extremes has the same data_min_/data_max_/scale_/min_
+    # as one fitted on the whole series, without passing the series through sklearn
+    return MinMaxScaler().fit(np.array([[data_min], [data_max]]))
+
+
+def create_sequence_groups(data, countries, target_columns, sequence_length, horizon=1, stride=1):
+    """
+    Builds the training windows of every (country, target column) pair.
+
+    :param data: The preprocessed dataset.
+    :param countries: Countries to build windows for.
+    :param target_columns: Target columns, e.g. ['wind_consumption', 'solar_consumption'].
+    :param sequence_length: Length of the input windows.
+    :param horizon: Number of following values each window predicts.
+    :param stride: Distance (in years) between the start of two windows.
+    :return: {(country, target_column): (X, y, scaler)} with X of shape (windows, sequence_length, 1)
+             and y of shape (windows, horizon), both read-only views into the scaled series, and the
+             MinMaxScaler of the series. Countries with fewer than sequence_length years are left out.
+    """
+    groups = {}
+    for country in countries:
+        country_data = country_rows(data, country)
+        if country_data.empty or len(country_data) < sequence_length:
+            print(f"Warning: Insufficient data for {country} to create sequences of length {sequence_length}.")
+            continue
+
+        values = country_data[target_columns].to_numpy(dtype=float)
+        data_min, data_max = values.min(axis=0), values.max(axis=0)
+        scalers = [_fit_scaler(low, high) for low, high in zip(data_min, data_max)]
+        # the same arithmetic as MinMaxScaler.transform, for all the target columns at once
+        scaled = values * np.array([scaler.scale_[0] for scaler in scalers]) + np.array([scaler.min_[0] for scaler in scalers])
+
+        windows = len(values) - sequence_length - horizon + 1
+        for column, (target_column, scaler) in enumerate(zip(target_columns, scalers)):
+            series = scaled[:, column]
+            if windows > 0:
+                X = sliding_window_view(series[:len(series) - horizon], sequence_length)[::stride, :, None]
+                y = sliding_window_view(series[sequence_length:], horizon)[::stride]
+            else:
+                X, y = np.empty((0, sequence_length, 1)), np.empty((0, horizon))
+            groups[(country, target_column)] = (X, y, scaler)
+
+    return groups
+
+
 def create_sequences(data, country, sequence_length, target_column):
-    
+
     print(country, sequence_length, target_column)
-    
-    country_data = data[data['country'] == country].sort_values(by='year')
-    if country_data.empty or len(country_data) < sequence_length:
-        print(f"Warning: Insufficient data for {country} to create sequences of length {sequence_length}.")
-        return None, None, None
 
-    scaler = MinMaxScaler()
-    scaled_data = scaler.fit_transform(country_data[[target_column]])
+    groups = create_sequence_groups(data, [country], [target_column], sequence_length)
+    if (country, target_column) not in groups:
+        return None, None, None
 
-    X_sequences, y_sequences = [], []
-    for i in range(len(scaled_data) - sequence_length):
-        X_sequences.append(scaled_data[i:i+sequence_length])
-        y_sequences.append(scaled_data[i+sequence_length])
-        
-    return np.array(X_sequences), np.array(y_sequences), scaler
-    
\ No newline at end of file
+    return groups[(country, target_column)]
@@ -0,0 +1,103 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Row-offset tables over the dataset, built once per DataFrame, so the handlers can select
+# a country's or a year's rows without comparing the whole 'country' / 'year' column
+# (data[data['country'] == country]) on every request.
+
+
+class DatasetIndex:
+
+    def __init__(self, data):
+        codes, countries = pd.factorize(data['country'], sort=False)
+        years = data['year'].to_numpy()
+
+        # positions of every country's rows, sorted by year (stable, so ties keep the file order)
+        order = np.lexsort((years, codes))
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        self.country_rows = {}
+        self.country_years = {}
+        for rows in np.split(order, boundaries):
+            if len(rows) and codes[rows[0]] >= 0:
+                country = countries[codes[rows[0]]]
+                self.country_rows[country] = _as_slice(rows)
+                self.country_years[country] = years[rows]
+
+        # positions of every year's rows, in the order they appear in the file
+        year_order = np.argsort(years, kind='stable')
+        year_boundaries = np.flatnonzero(np.diff(years[year_order])) + 1
+        self.year_rows = {int(years[rows[0]]): rows for rows in np.split(year_order, year_boundaries) if len(rows)}
+
+        # the float32 columns of a compact dataset (read back as the source values, see source_values)
+        self.float32_columns = [column for column, dtype in data.dtypes.items() if dtype == np.float32]
+
+        # case-insensitive country names -> the names used in the file
+        self.country_names = {}
+        for country in self.country_rows:
+            self.country_names.setdefault(str(country).lower(), []).append(country)
+
+
+def _as_slice(rows):
+    # contiguous rows are kept as a slice, so selecting them is a view rather than a copy
+    if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+
+_indexes = {}  # id(DataFrame) -> (weak reference to the DataFrame, DatasetIndex)
+_lock = threading.Lock()
+
+
+def get_dataset_index(data):
+    """
+    Returns the index of a DataFrame, building it the first time it is asked for.
+    The index is dropped when the DataFrame is garbage collected.
+    """
+    key = id(data)
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0]() is data:
+            return entry[1]
+
+    index = DatasetIndex(data)
+    with _lock:
+        _indexes[key] = (weakref.ref(data, lambda _, key=key: _indexes.pop(key, None)), index)
+    return index
+
+
+def _rows(data, rows):
+    if rows is None:
+        return data.iloc[0:0]
+    return data.iloc[rows]
+
+
+def country_rows(data, country):
+    # All rows of a country, sorted by year (empty if the country isn't in the data)
+    return _rows(data, get_dataset_index(data).country_rows.get(country))
+
+
+def year_rows(data, year):
+    # All rows of a year, in file order (empty if the year isn't in the data)
+    return _rows(data, get_dataset_index(data).year_rows.get(int(year)))
+
+
+def country_year_rows(data, country, year):
+    # The rows of a country in one year, found by binary search in the country's sorted years
+    index = get_dataset_index(data)
+    rows = index.country_rows.get(country)
+    if rows is None:
+        return data.iloc[0:0]
+
+    years = index.country_years[country]
+    start, stop = np.searchsorted(years, year, side='left'), np.searchsorted(years, year, side='right')
+    if isinstance(rows, slice):
+        return data.iloc[rows.start + start:rows.start + stop]
+    return data.iloc[rows[start:stop]]
+
+
+def find_countries(data, country):
+    # The names in the data that match a country name case-insensitively
+    return get_dataset_index(data).country_names.get(str(country).lower(), [])
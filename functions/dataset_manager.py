@@ -0,0 +1,201 @@
+import os
+import time
+import shutil
+import threading
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+
+import pandas as pd
+
+from functions.load_cleaned_dataset import load_cleaned_dataset
+from cols_to_check import features
+
+# Owns the dataset the server answers from. A new release of the OWID file is downloaded (streamed
+# to disk in chunks), validated and cleaned in a background thread while the current dataset keeps
+# being served, and then swapped in at once: a request works on the ServedDataset it read, the next
+# request gets the new one. Every swap gets the next version number.
+
+# what the handlers read: the cleaned DataFrame, the fingerprint of its source file
+# (load_cleaned_dataset's version string), the swap counter and when it was swapped in
+ServedDataset = namedtuple('ServedDataset', ['data', 'fingerprint', 'version', 'loaded_at'])
+
+# columns a source file needs, besides the features, to be cleaned and served
+required_columns = ['country', 'year', 'iso_code']
+
+
+class DatasetNotLoaded(RuntimeError):
+    # raised by require() while the first dataset is still loading (or failed to load)
+    pass
+
+
+def download_file(url, path, chunk_size=1024 * 1024):
+    # Streams url (http(s):// or file://) to path chunk by chunk, without holding the file in memory
+    tmp_path = path + '.part'
+    try:
+        with urllib.request.urlopen(url) as response, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(response, f, chunk_size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def check_refresh_url(url, allowed_hosts):
+    # A url sent to the admin API must be https on one of allowed_hosts (not file:// or an internal address)
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != 'https' or parts.hostname not in allowed_hosts:
+        raise ValueError(f"The url must be https on one of: {', '.join(sorted(allowed_hosts)) or 'no host'}")
+
+
+def validate_source(path):
+    # Checks the header of a downloaded file before it is cleaned
+    columns = set(pd.read_csv(path, nrows=0).columns)
+    missing = [column for column in required_columns + features if column not in columns]
+    if missing:
+        listed = ', '.join(missing[:10]) + (', ...' if len(missing) > 10 else '')
+        raise ValueError(f"The dataset is missing {len(missing)} columns: {listed}")
+
+
+class DatasetManager:
+
+    def __init__(self, file_path, url, cache_dir='dataset_cache', cleaned_csv_path='cleaned_dataset.csv', compact=False):
+        self.file_path = file_path
+        self.url = url
+        self.cache_dir = cache_dir
+        self.cleaned_csv_path = cleaned_csv_path
+        self.compact = compact
+
+        self._served = None
+        self._swap_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._prepare_hooks = []
+        self._swap_listeners = []
+        self._status = {'loading': False, 'load_error': None, 'refreshing': False, 'last_refresh': None}
+
+    def add_prepare_hook(self, hook):
+        # hook(data) runs on a new dataset before it is served, e.g. to build its indexes
+        self._prepare_hooks.append(hook)
+
+    def add_swap_listener(self, listener):
+        # listener(served) runs after a new dataset is swapped in, e.g. to drop caches of the old one
+        self._swap_listeners.append(listener)
+
+    def current(self):
+        """
+        Returns the ServedDataset. A handler should read it once and use that snapshot for the
+        whole request, so it never mixes two versions of the dataset.
+        """
+        return self._served
+
+    def require(self):
+        # The ServedDataset, or DatasetNotLoaded while there is none yet
+        served = self._served
+        if served is None:
+            raise DatasetNotLoaded(self._status['load_error'] or 'The dataset is still loading')
+        return served
+
+    def load(self):
+        # Loads the local file (downloading it first if it doesn't exist) and serves it
+        with self._load_lock:
+            if self._served is not None:
+                return self._served
+            self._status.update(loading=True, load_error=None)
+            try:
+                if not os.path.exists(self.file_path):
+                    print("File does not exist. Downloading...")
+                    download_file(self.url, self.file_path)
+                    print("File downloaded and saved.")
+                else:
+                    print("File already exists.")
+
+                self._swap(*self._build(self.file_path))
+            except Exception as error:
+                self._status['load_error'] = f"The dataset could not be loaded: {error}"
+                raise
+            finally:
+                self._status['loading'] = False
+        return self._served
+
+    def load_in_background(self):
+        # Starts load() in a thread; until it is done, current() is None and require() raises DatasetNotLoaded
+        def run():
+            try:
+                self.load()
+            except Exception as error:
+                print(f"Warning: {self._status['load_error'] or error}")
+
+        self._status['loading'] = True
+        threading.Thread(target=run, name='dataset-load', daemon=True).start()
+
+    def _build(self, path):
+        dataset, fingerprint = load_cleaned_dataset(path, cache_dir=self.cache_dir, cleaned_csv_path=self.cleaned_csv_path, compact=self.compact)
+        if dataset.empty:
+            raise ValueError(f"No rows left in {path} after cleaning")
+        for hook in self._prepare_hooks:
+            hook(dataset)
+        return dataset, fingerprint
+
+    def _swap(self, dataset, fingerprint):
+        with self._swap_lock:
+            version = self._served.version + 1 if self._served is not None else 1
+            self._served = served = ServedDataset(dataset, fingerprint, version, time.time())
+        for listener in self._swap_listeners:
+            listener(served)
+
+    def refresh(self, url=None, wait=False):
+        """
+        Downloads the dataset again (from url, the manager's url by default) and swaps it in when
+        it is valid and different from the served one, in a background thread.
+
+        :param wait: Return only when the refresh is done.
+        :return: False if a refresh is already running, True otherwise.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        self._status['refreshing'] = True
+        thread = threading.Thread(target=self._refresh, args=(url or self.url,), name='dataset-refresh', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _refresh(self, url):
+        download_path = self.file_path + '.download'
+        started = time.time()
+        result = {'url': url, 'started_at': started}
+        try:
+            download_file(url, download_path)
+            validate_source(download_path)
+            dataset, fingerprint = self._build(download_path)
+
+            if self._served is not None and fingerprint == self._served.fingerprint:
+                os.remove(download_path)
+                result['result'] = 'unchanged'
+            else:
+                # the new file replaces the local copy only once it was cleaned successfully
+                os.replace(download_path, self.file_path)
+                self._swap(dataset, fingerprint)
+                result['result'] = 'swapped'
+        except Exception as error:
+            print(f"Warning: dataset refresh from {url} failed: {error}")
+            if os.path.exists(download_path):
+                os.remove(download_path)
+            result.update(result='failed', error=str(error))
+        finally:
+            result['seconds'] = time.time() - started
+            result['version'] = self._served.version if self._served else None
+            self._status.update(refreshing=False, last_refresh=result)
+            self._refresh_lock.release()
+
+    def status(self):
+        served = self._served
+        return {
+            'version': served.version if served else None,
+            'fingerprint': served.fingerprint if served else None,
+            'loaded_at': served.loaded_at if served else None,
+            'rows': len(served.data) if served else 0,
+            **self._status,
+        }
@@ -0,0 +1,87 @@
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+
+# use the sys path, so the functions package can be imported when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.lstm_numpy import lstm_weights_from_keras, save_numpy_model, load_numpy_model
+
+# Exports the saved_models/**/*.h5 models (and their scalers) to .npz files next to them,
+# so the web server can serve predictions with lstm_numpy instead of importing TensorFlow.
+# Run after training:
+#     python functions/export_numpy_weights.py --verify
+
+
+def numpy_model_path(model_path):
+    # saved_models/<country>/<energy>/<country>_<energy>_consumption.h5 -> ..._consumption.npz
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def export_model(model_path, scaler_path):
+    # TensorFlow is only needed here, at export time
+    from functions.create_lstm_model import load_model_and_scaler
+
+    model, scaler = load_model_and_scaler(model_path, scaler_path)
+    if model is None or scaler is None:
+        return None
+
+    export_path = numpy_model_path(model_path)
+    save_numpy_model(export_path, lstm_weights_from_keras(model), scaler, source_path=model_path)
+    return export_path
+
+
+def verify_export(model_path, scaler_path, samples=256, sequence_length=5, seed=0):
+    """
+    Compares the exported NumPy model against the Keras model on random scaled windows.
+
+    :return: The largest absolute difference between the two models' outputs.
+    """
+    from functions.create_lstm_model import load_model_and_scaler
+
+    keras_model, _ = load_model_and_scaler(model_path, scaler_path)
+    numpy_model, _ = load_numpy_model(numpy_model_path(model_path))
+    if keras_model is None or numpy_model is None:
+        return None
+
+    # MinMax-scaled inputs are in [0, 1]; autoregressive rollouts can leave that range a bit
+    inputs = np.random.default_rng(seed).uniform(-0.5, 1.5, size=(samples, sequence_length, 1)).astype(np.float32)
+    keras_output = np.asarray(keras_model(inputs, training=False))
+    numpy_output = numpy_model(inputs)
+    return float(np.max(np.abs(keras_output - numpy_output)))
+
+
+def export_all(models_dir='saved_models', verify=False, tolerance=1e-5):
+    failures = []
+    for model_path in sorted(glob.glob(os.path.join(models_dir, '**', '*_consumption.h5'), recursive=True)):
+        scaler_path = os.path.splitext(model_path)[0] + '_scaler.pkl'
+        export_path = export_model(model_path, scaler_path)
+        if export_path is None:
+            failures.append(model_path)
+            continue
+        print(f"Exported {model_path} -> {export_path}")
+
+        if verify:
+            max_difference = verify_export(model_path, scaler_path)
+            if max_difference is None or max_difference > tolerance:
+                failures.append(model_path)
+            else:
+                print(f"  max |keras - numpy| = {max_difference:.2e}")
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export saved LSTM models to NumPy .npz files.')
+    parser.add_argument('--models-dir', default='saved_models')
+    parser.add_argument('--verify', action='store_true', help='check the exported models against the Keras outputs')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    failed = export_all(args.models_dir, verify=args.verify, tolerance=args.tolerance)
+    if failed:
+        print(f"Failed: {failed}")
+        sys.exit(1)
@@ -1,41 +1,75 @@
+import numpy as np
+
+from functions.dataset_index import get_dataset_index
+from functions.metrics import timed
+from functions.load_cleaned_dataset import source_values
+
+# Adjusts start_year and end_year to years that are available for a country
+def resolve_year_range(available_years, start_year=None, end_year=None):
+    available_years = np.sort(np.asarray(available_years))  # Sort years to binary-search the nearest
+    return _clamp_years(available_years, start_year, end_year)
+
+def _clamp_years(years, start_year, end_year):
+    # years is sorted; a year that isn't available becomes the nearest smaller one, or the
+    # first (start_year) / last (end_year) available year if there is no smaller one
+    if start_year is not None:
+        position = np.searchsorted(years, start_year, side='left')
+        if position == len(years) or years[position] != start_year:
+            start_year = int(years[position - 1] if position > 0 else years[0])
+    if end_year is not None:
+        position = np.searchsorted(years, end_year, side='left')
+        if position == len(years) or years[position] != end_year:
+            end_year = int(years[position - 1] if position > 0 else years[-1])
+
+    return start_year, end_year
+
+def _country_years(data, country):
+    index = get_dataset_index(data)
+    rows = index.country_rows.get(country)
+    if rows is None:
+        raise ValueError(f"No data available for {country}. Please check the country name.")
+    return rows, index.country_years[country]
+
+# The start and end years filter_energy_data will actually use for a country
+def country_year_range(data, country, start_year=None, end_year=None):
+    _, years = _country_years(data, country)
+    return _clamp_years(years, start_year, end_year)
+
 # Filters energy consumption data for a specific country and optional time period.
-def filter_energy_data(data, country, start_year=None, end_year=None):
-    
-    country_data = data[data['country'] == country].copy() #make a new copy for this filtered dataset
+@timed('filter')
+def filter_energy_data(data, country, start_year=None, end_year=None, columns=None):
+    """
+    Returns the rows of a country between start_year and end_year (clamped to the available years).
+
+    The country's rows are sorted by year in the dataset index, so the period is found by binary
+    search and, for a country stored in one block of rows, returned as a view of the dataset
+    rather than a copy: treat it as read-only. The float32 columns of a compact dataset are returned
+    as the float64 values of the source file (a copy).
 
+    :param columns: Only select these columns (e.g. ['year', 'solar_consumption']), all if None.
+    :return: (country_data, start_year, end_year)
+    """
     # Check if the dataset contains any records for the specified country
-    if country_data.empty:
-        raise ValueError(f"No data available for {country}. Please check the country name.")
+    rows, years = _country_years(data, country)
+    float32_columns = get_dataset_index(data).float32_columns
 
-    # Get the min and max available years
-    available_years = country_data['year'].unique()
-    available_years.sort()  # Sort years to make it easier to find the nearest
+    # Adjust start_year and end_year to the available years
+    start_year, end_year = _clamp_years(years, start_year, end_year)
 
-    min_year = available_years.min()
-    max_year = available_years.max()
+    # Positions of the period in the country's sorted years
+    first = np.searchsorted(years, start_year, side='left') if start_year is not None else 0
+    last = np.searchsorted(years, end_year, side='right') if end_year is not None else len(years)
+    last = max(first, last)
 
-    # Adjust start_year and end_year if they are not in the available years
-    if start_year is not None:
-        if start_year not in available_years:
-            # Find the nearest smaller year
-            valid_start_years = [year for year in available_years if year < start_year]
-            if valid_start_years:
-                start_year = max(valid_start_years)
-            else:
-                start_year = min_year  # If no smaller year is available, set to min year
-    if end_year is not None:
-        if end_year not in available_years:
-            # Find the nearest smaller year
-            valid_end_years = [year for year in available_years if year < end_year]
-            if valid_end_years:
-                end_year = max(valid_end_years)
-            else:
-                end_year = max_year  # If no smaller year is available, set to max year
-
-    # Apply filtering by year if start_year and end_year are provided
-    if start_year is not None:
-        country_data = country_data[country_data['year'] >= start_year]
-    if end_year is not None:
-        country_data = country_data[country_data['year'] <= end_year]
+    if isinstance(rows, slice):
+        rows = slice(rows.start + first, rows.start + last)
+    else:
+        rows = rows[first:last]
+
+    if columns is None:
+        return source_values(data.iloc[rows], float32_columns), start_year, end_year
 
-    return country_data, start_year, end_year
\ No newline at end of file
+    positions = data.columns.get_indexer(columns)
+    if (positions < 0).any():
+        raise KeyError(f"Columns not in the dataset: {[column for column, position in zip(columns, positions) if position < 0]}")
+    return source_values(data.iloc[rows, positions], float32_columns), start_year, end_year
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+# use the sys path, so the functions package can be imported when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.predict_energy_year import predictions_up_to_year
+
+# Persistent store of forecast trajectories. A rollout of a model is deterministic for a given
+# model file and dataset, so each computed trajectory is saved in a SQLite file keyed by
+# (country, energy type, sha256 of the model file, dataset version, sequence length) and later
+# requests for that year, or any earlier one, are answered from it without running the model.
+# A trajectory starts at the year after the last known one, so the prediction for an earlier
+# year is a prefix of a longer trajectory; only the longest one is kept.
+#
+# Pre-fill it after training with the offline precompute (see README):
+#     python functions/precomputed_forecasts.py --until 2035 --store forecast_store.sqlite3
+
+store_path = 'forecast_store.sqlite3'
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'writes': 0,
+    'errors': 0,
+}
+
+
+def _connection():
+    # one connection per thread (and per store path)
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and _local.path == store_path:
+        return connection
+
+    connection = sqlite3.connect(store_path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS forecasts (
+            country TEXT NOT NULL,
+            energy_type TEXT NOT NULL,
+            model_version TEXT NOT NULL,
+            dataset_version TEXT NOT NULL,
+            sequence_length INTEGER NOT NULL,
+            end_year INTEGER NOT NULL,
+            trajectory TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (country, energy_type, model_version, dataset_version, sequence_length)
+        )''')
+    connection.commit()
+    _local.connection, _local.path = connection, store_path
+    return connection
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def lookup_forecast(country, energy_type, model_version, dataset_version, prediction_year, sequence_length=5):
+    """
+    Returns the stored predictions of a country and energy type up to prediction_year
+    (as returned by predict_energy_year), or None if no stored trajectory reaches that year.
+    """
+    if not store_path or model_version is None:
+        return None
+    try:
+        row = _connection().execute(
+            'SELECT end_year, trajectory FROM forecasts WHERE country = ? AND energy_type = ? AND model_version = ? '
+            'AND dataset_version = ? AND sequence_length = ?',
+            (country, energy_type, model_version, str(dataset_version), sequence_length)).fetchone()
+    except sqlite3.Error as error:
+        print(f"Warning: could not read the forecast store {store_path}: {error}")
+        _count('errors')
+        return None
+
+    if row is None or row[0] < prediction_year:
+        _count('misses')
+        return None
+    _count('hits')
+    return predictions_up_to_year(json.loads(row[1]), prediction_year)
+
+
+def save_forecast(country, energy_type, model_version, dataset_version, predictions, sequence_length=5):
+    # Stores a computed trajectory, unless a longer one is already stored
+    if not store_path or model_version is None or not isinstance(predictions, list) or not predictions:
+        return
+    try:
+        connection = _connection()
+        connection.execute(
+            'INSERT INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (country, energy_type, model_version, dataset_version, sequence_length) DO UPDATE SET '
+            'end_year = excluded.end_year, trajectory = excluded.trajectory, created_at = excluded.created_at '
+            'WHERE excluded.end_year > forecasts.end_year',
+            (country, energy_type, model_version, str(dataset_version), sequence_length,
+             int(predictions[-1]['year']), json.dumps(predictions), time.time()))
+        connection.commit()
+    except sqlite3.Error as error:
+        print(f"Warning: could not write to the forecast store {store_path}: {error}")
+        _count('errors')
+        return
+    _count('writes')
+
+
+def configure_forecast_store(path=None):
+    # path of the SQLite file, '' to disable the store
+    global store_path
+    if path is not None:
+        store_path = path
+
+
+def forecast_store_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['path'] = store_path
+    if store_path and os.path.exists(store_path):
+        stats['bytes'] = os.path.getsize(store_path)
+        try:
+            stats['trajectories'] = _connection().execute('SELECT COUNT(*) FROM forecasts').fetchone()[0]
+        except sqlite3.Error:
+            pass
+    return stats
+
+
+def saved_model_types(models_dir='saved_models'):
+    # (country, energy type) of every model in saved_models/<country>/<energy>/
+    pairs = []
+    for country in sorted(os.listdir(models_dir)):
+        country_dir = os.path.join(models_dir, country)
+        if os.path.isdir(country_dir):
+            pairs.extend((country, energy_type) for energy_type in sorted(os.listdir(country_dir))
+                         if os.path.isdir(os.path.join(country_dir, energy_type)))
+    return pairs
+
+
+def forecast_saved_models(data, until_year, models_dir='saved_models', countries=None, energy_types=None, sequence_length=5):
+    """
+    Rolls every saved model (of the countries / energy types, all if None) forward to until_year with the
+    batched inference, one country at a time so each model is loaded once (the offline precompute of
+    functions/precomputed_forecasts.py, which also pre-fills the store).
+
+    :return: Yields (country, {energy_type: predictions}) as returned by forecast_all_energy_types.
+    """
+    from functions.batched_inference import forecast_all_energy_types
+
+    by_country = {}
+    for country, energy_type in saved_model_types(models_dir):
+        if (countries is None or country in countries) and (energy_types is None or energy_type in energy_types):
+            by_country.setdefault(country, []).append(energy_type)
+
+    for country, types in by_country.items():
+        yield country, forecast_all_energy_types(country, data, types, until_year, sequence_length)
+
@@ -1,6 +1,12 @@
 # The following functions have been created
 # by Malik
 
+import pandas as pd
+
+from functions.dataset_index import year_rows, country_year_rows, find_countries
+from functions.yearly_rollups import get_yearly_rollups
+from functions.load_cleaned_dataset import source_values
+
 renewable_types = ["wind_share_elec", "solar_share_energy", "hydro_share_elec"]
 
 fossil_types = ["coal_share_elec", "oil_share_elec", "gas_share_elec", "nuclear_share_elec"]
@@ -15,6 +21,13 @@ energy_types = {
     'Wind': 'wind_consumption',
 }
 
+# columns of the yearly rollups the functions below read
+rollup_columns = list(energy_types.values()) + renewable_types + fossil_types
+
+def energy_rollups(data):
+    # Per-year totals, means and top 5 countries (without the aggregate regions), computed once per dataset
+    return get_yearly_rollups(data, rollup_columns, top_k=5)
+
 def get_energy_consumption(data, year):
     """
     Returns energy consumption for all types in a given year.
@@ -23,14 +36,14 @@ def get_energy_consumption(data, year):
     :param year: The year for which to extract the data.
     :return: A Series containing energy consumption values for that year.
     """
-    filtered_df = data[data["year"] == year]
+    filtered_df = year_rows(data, year)
 
     if filtered_df.empty:
         return f"No data available for the year {year}"
 
     energy_columns = [col for col in data.columns if "consumption" in col.lower()]
     
-    data_merged = filtered_df[["year", "country"] + energy_columns]
+    data_merged = source_values(filtered_df[["year", "country"] + energy_columns])
     json_data = data_merged.set_index("country").to_dict(orient="index")
 
     return json_data
@@ -42,16 +55,16 @@ def get_energy_consumption_by_year(data, year):
     :param year: The year for which to extract the energy consumption data.
     :return: A dictionary containing the energy consumption values for each type of energy.
     """
-    filtered_data = data[data["year"] == year]
+    rollups = energy_rollups(data)
 
-    if filtered_data.empty:
+    if year not in rollups.years:
         return f"No data available for the year {year}"
 
     energy_consumption = {}
 
     for energy_type, col in energy_types.items():
-        if col in filtered_data.columns:
-            energy_consumption[energy_type] = filtered_data[col].sum()  # Sum all values for that year
+        if col in rollups.columns:
+            energy_consumption[energy_type] = rollups.totals[year][col]  # Sum of all countries for that year
         else:
             energy_consumption[energy_type] = None  # If the column is missing, set it to None
     
@@ -60,25 +73,21 @@ def get_energy_consumption_by_year(data, year):
 
 def get_top_renewable_countries_by_year(data, year):
     """
-    Returns the top 5 countries for each type of renewable energy in a given year.
+    Returns the top 5 countries (aggregate regions excluded) for each type of renewable energy in a given year.
 
     :param year: The year for which to extract the top renewable energy countries.
     :return: A dictionary containing top 5 countries for each renewable energy type.
     """
-    filtered_data = data[data["year"] == year]
+    rollups = energy_rollups(data)
 
-    if filtered_data.empty:
+    if year not in rollups.years:
         return f"No data available for the year {year}"
 
     top_countries = {}
    
     for energy_type in renewable_types:
-        if energy_type in filtered_data.columns:
-            top_countries[energy_type] = (
-                filtered_data[["country", energy_type]]
-                .nlargest(5, energy_type)["country"]
-                .tolist()
-            )
+        if energy_type in rollups.columns:
+            top_countries[energy_type] = list(rollups.top[year][energy_type])
 
     return top_countries
 
@@ -90,40 +99,36 @@ def get_renewable_energy_shares_by_year(data, year):
     :param year: The year for which to extract the energy shares.
     :return: A dictionary containing the average share of each renewable energy type in that year.
     """
-    filtered_data = data[data["year"] == year]
+    rollups = energy_rollups(data)
 
-    if filtered_data.empty:
+    if year not in rollups.years:
         return f"No data available for the year {year}"
 
     renewable_shares = {}
     for energy_type in renewable_types:
-        if energy_type in filtered_data.columns:
-            renewable_shares[energy_type] = filtered_data[energy_type].mean()
+        if energy_type in rollups.columns:
+            renewable_shares[energy_type] = rollups.means[year][energy_type]
 
     return renewable_shares
 
 
 def get_top_fossil_countries_by_year(data, year):
     """
-    Returns the top 5 countries for each type of non-renewable (fossil and nuclear) energy in a given year.
+    Returns the top 5 countries (aggregate regions excluded) for each type of non-renewable (fossil and nuclear) energy in a given year.
 
     :param year: The year for which to extract the top non-renewable energy countries.
     :return: A dictionary containing the top 5 countries for each non-renewable energy type.
     """
-    filtered_data = data[data["year"] == year]
+    rollups = energy_rollups(data)
 
-    if filtered_data.empty:
+    if year not in rollups.years:
         return f"No data available for the year {year}"
 
     top_countries = {}
 
     for energy_type in fossil_types:
-        if energy_type in filtered_data.columns:
-            top_countries[energy_type] = (
-                filtered_data[["country", energy_type]]
-                .nlargest(5, energy_type)["country"]
-                .tolist()
-            )
+        if energy_type in rollups.columns:
+            top_countries[energy_type] = list(rollups.top[year][energy_type])
 
     return top_countries
 
@@ -137,7 +142,9 @@ def get_energy_consumption_by_type_and_year_for_country(data, year, energy_type,
     :param country: The country for which to extract the energy consumption data.
     :return: A DataFrame containing the energy consumption for the given type, year, and country.
     """
-    filtered_df = data[(data["year"] == year) & (data["country"].str.lower() == country.lower())]
+    # case-insensitive country lookup through the dataset index
+    matches = [country_year_rows(data, name, year) for name in find_countries(data, country)]
+    filtered_df = pd.concat(matches) if len(matches) > 1 else (matches[0] if matches else data.iloc[0:0])
 
     if filtered_df.empty:
         return f"No data available for {country} in the year {year}"
@@ -147,7 +154,7 @@ def get_energy_consumption_by_type_and_year_for_country(data, year, energy_type,
     if energy_column not in filtered_df.columns:
         return f"No data available for the energy type {energy_type} in {country} for the year {year}"
     
-    data_merged = filtered_df[["year", "country", energy_column]].copy()
+    data_merged = source_values(filtered_df[["year", "country", energy_column]]).copy()
     data_merged = data_merged.rename(columns={energy_column: "consumption"})
     data_merged["type"] = energy_type
     json_data = data_merged.set_index("country").to_dict(orient="index")
@@ -0,0 +1,120 @@
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from functions.metrics import stages_of
+
+# Runs long forecasts off the request thread. A request submits a job and gets its id back right
+# away, then polls it (optionally waiting for it to finish). Jobs run on a bounded pool of threads;
+# submitting the same work while it is queued or running returns the existing job, and finished
+# jobs are kept for a while so the same request is answered from the stored result.
+# A job outlives the request that submitted it, so its stages (predict, model_load, ...) are kept in
+# the job itself (seconds per stage) rather than in that request's Server-Timing header.
+
+
+class JobQueue:
+
+    def __init__(self, max_workers=2, max_jobs=256, result_ttl=3600):
+        """
+        :param max_workers: Threads running the jobs.
+        :param max_jobs: Finished jobs kept for polling and reuse (the oldest are dropped first).
+        :param result_ttl: Seconds a finished job's result is reused for the same request.
+        """
+        self.max_jobs = max_jobs
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()  # job id -> job
+        self._by_key = {}  # request key -> job id
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'reused': 0, 'completed': 0, 'failed': 0}
+
+    @staticmethod
+    def job_key(kind, params):
+        return json.dumps([kind, sorted((name, value) for name, value in params.items() if value is not None)], default=str)
+
+    def submit(self, kind, params, work):
+        """
+        Queues work() unless the same kind and params are already queued, running or finished
+        within result_ttl, in which case that job is returned instead.
+
+        :param kind: Name of the work, e.g. 'ten_years'.
+        :param params: The parameters the result depends on (include the dataset version).
+        :param work: Function computing the result.
+        :return: A copy of the job.
+        """
+        key = self.job_key(kind, params)
+        with self._lock:
+            job = self._jobs.get(self._by_key.get(key))
+            if job is not None:
+                if job['status'] in ('queued', 'running'):
+                    self._stats['deduplicated'] += 1
+                    return dict(job)
+                if job['status'] == 'done' and time.time() - job['finished_at'] < self.result_ttl:
+                    self._stats['reused'] += 1
+                    return dict(job)
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'params': params,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'stages': None,
+            }
+            self._jobs[job['id']] = job
+            self._by_key[key] = job['id']
+            self._stats['submitted'] += 1
+            self._prune()
+
+        self._executor.submit(self._run, job, work)
+        return dict(job)
+
+    def _run(self, job, work):
+        with self._lock:
+            job.update(status='running', started_at=time.time())
+        stages = {}
+        try:
+            with stages_of(stages):
+                result, error, status = work(), None, 'done'
+        except Exception as exception:
+            result, error, status = None, str(exception), 'failed'
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time(),
+                       stages={name: round(seconds, 6) for name, seconds in stages.items()})
+            self._stats['completed' if status == 'done' else 'failed'] += 1
+            self._finished.notify_all()
+
+    def _prune(self):
+        # drop the oldest finished jobs beyond max_jobs (queued and running jobs are always kept)
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            job = self._jobs.pop(job_id)
+            key = self.job_key(job['kind'], job['params'])
+            if self._by_key.get(key) == job_id:
+                del self._by_key[key]
+
+    def get(self, job_id, wait=0):
+        """
+        Returns a copy of a job (None if unknown), after waiting up to wait seconds for it to finish.
+        """
+        deadline = time.time() + wait
+        with self._lock:
+            job = self._jobs.get(job_id)
+            while job is not None and job['status'] in ('queued', 'running') and time.time() < deadline:
+                self._finished.wait(deadline - time.time())
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            for status in ('queued', 'running', 'done', 'failed'):
+                stats[status] = sum(1 for job in self._jobs.values() if job['status'] == status)
+        return stats
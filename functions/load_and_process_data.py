@@ -18,6 +18,12 @@ def load_and_preprocess_data(csv_path, energy_type):
         print(f"Error: CSV file not found at {csv_path}")
         return None
 
+    return preprocess_data(data, energy_type)
+
+
+def preprocess_data(data, energy_type):
+    # energy_type is a target column, or a list of them when the data is prepared once for several models
+
     # Drop unnecessary columns
     columns_to_drop = ['iso_code', 'population', 'gdp']
     data = data.drop(columns=columns_to_drop, errors='ignore')
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# use the sys path, so the cols_to_check could be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cols_to_check import features, served_features
+
+# Cleaning of the OWID dataset for the server, and a binary cache of its result.
+# The cache is a directory of .npy files (one 2D array per dtype, stored column by column)
+# named after the sha256 of the source CSV; on the next start the arrays are memory-mapped
+# instead of parsing and cleaning the CSV again.
+
+# bump when clean_dataset (or compact_dataset) changes, so existing caches are not reused
+cleaning_version = 2
+
+# Compact mode: only the columns the server reads, 'country' as a categorical, 'year' as int16 and
+# the metrics as float32 when float32 keeps the source values exactly: the shortest decimal of every
+# float32 value is the number of the source file (e.g. 2202.494), which source_values turns back into
+# that float64 number before it is summed or sent, so compact mode answers the same numbers as the default mode
+# a cache directory on tmpfs: its memory maps are shared RAM for all the worker processes
+shared_memory_cache_dir = '/dev/shm/energy-dataset-cache'
+
+
+def clean_dataset(dataset):
+    # Drop unnecessary columns:
+    dataset = dataset.drop(columns=['iso_code'])
+
+    # Check for missing values and replace them with zeros
+    dataset = dataset.fillna(0)
+
+    # Convert year to integer type
+    dataset['year'] = dataset['year'].astype(int)
+
+    # Columns to exclude from conversion
+    exclude_columns = ['country', 'year', 'iso_code', 'population', 'gdp']
+
+    # Convert all other columns to float
+    for col in dataset.columns:
+        if col not in exclude_columns:
+            dataset[col] = dataset[col].astype(float)
+
+    # Check for duplicate rows
+    duplicate_rows = dataset.duplicated()
+    num_duplicates = duplicate_rows.sum()
+    print(f"Number of duplicate rows: {num_duplicates}")
+
+    # Display duplicate rows if any
+    if num_duplicates > 0:
+        print(dataset[duplicate_rows])
+        dataset = dataset.drop_duplicates()
+
+    # Keep only the columns that actually exist in the DataFrame
+    existing_cols = [col for col in features if col in dataset.columns]
+
+    # Drop rows where all these columns are 0
+    if existing_cols:
+        dataset = dataset[dataset[existing_cols].ne(0).any(axis=1)]
+
+    return dataset
+
+
+def _fits_float32(values):
+    # float32 holds the column if the shortest decimal of each float32 value is the source value
+    narrowed = values.astype(np.float32)
+    return np.array_equal(narrowed.astype(str).astype(np.float64), values, equal_nan=True)
+
+
+def source_values(frame, float32_columns=None):
+    """
+    Returns frame (a DataFrame or Series) with its float32 columns (compact mode) as the float64 values
+    of the source file, read from the shortest decimal of each value. Frames without float32 columns
+    are returned as they are.
+
+    :param float32_columns: The float32 columns of the whole dataset when they are known
+                            (DatasetIndex.float32_columns), so the dtypes of frame are not scanned.
+    """
+    if isinstance(frame, pd.Series):
+        if frame.dtype != np.float32:
+            return frame
+        return pd.Series(frame.to_numpy().astype(str).astype(np.float64), index=frame.index, name=frame.name)
+
+    if float32_columns is not None:
+        columns = [column for column in float32_columns if column in frame.columns] if float32_columns else []
+    else:
+        columns = [column for column, dtype in frame.dtypes.items() if dtype == np.float32]
+    if not columns:
+        return frame
+    frame = frame.copy()
+    for column in columns:
+        frame[column] = frame[column].to_numpy().astype(str).astype(np.float64)
+    return frame
+
+
+def compact_dataset(dataset):
+    """
+    Returns a smaller copy of the cleaned dataset: only the features and served_features columns,
+    'country' as a categorical, 'year' as int16 and every float column whose values float32 keeps
+    exactly (see _fits_float32) as float32; the others stay float64.
+    """
+    wanted = set(features) | set(served_features)
+    compact = {}
+    for column in dataset.columns:
+        if column not in wanted:
+            continue
+        values = dataset[column]
+        if column == 'country':
+            values = values.astype('category')
+        elif column == 'year' and values.between(np.iinfo(np.int16).min, np.iinfo(np.int16).max).all():
+            values = values.astype(np.int16)
+        elif pd.api.types.is_float_dtype(values) and _fits_float32(values.to_numpy()):
+            values = values.astype(np.float32)
+        compact[column] = values
+    return pd.DataFrame(compact, index=dataset.index)
+
+
+def memory_usage(dataset):
+    # Bytes held by the dataset, text and categories included
+    return int(dataset.memory_usage(deep=True).sum())
+
+
+def source_fingerprint(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_dataset_cache(dataset, cache_path):
+    """
+    Writes the dataset as .npy files: one (columns, rows) array per numeric dtype, and
+    integer codes + labels for text columns. Written to a temporary directory of its own first,
+    so a reader never sees a half-written cache and workers building it at the same time don't
+    touch each other's files: the first one to finish installs it, the others keep its copy.
+    """
+    cache_dir, cache_name = os.path.split(os.path.abspath(cache_path))
+    tmp_path = tempfile.mkdtemp(prefix=cache_name + '.tmp-', dir=cache_dir)
+    os.chmod(tmp_path, 0o755)
+
+    groups = []
+    for dtype, columns in _dtype_groups(dataset):
+        name = f"block_{len(groups)}"
+        if pd.api.types.is_numeric_dtype(dtype):
+            np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(dataset[columns].to_numpy(dtype=dtype).T))
+            groups.append({'name': name, 'kind': 'numeric', 'dtype': str(dtype), 'columns': columns})
+        else:
+            for column in columns:
+                codes, labels = pd.factorize(dataset[column])
+                np.save(os.path.join(tmp_path, f"{name}_{column}_codes.npy"), codes.astype(np.int32))
+                np.save(os.path.join(tmp_path, f"{name}_{column}_labels.npy"), np.asarray(labels, dtype=str))
+            groups.append({'name': name, 'kind': 'text', 'dtype': str(dtype), 'columns': columns})
+
+    np.save(os.path.join(tmp_path, 'index.npy'), dataset.index.to_numpy(dtype=np.int64))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'cleaning_version': cleaning_version, 'rows': len(dataset), 'groups': groups}, f)
+
+    try:
+        _install_cache(tmp_path, cache_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _valid_cache(cache_path):
+    try:
+        with open(os.path.join(cache_path, 'meta.json')) as f:
+            return json.load(f).get('cleaning_version') == cleaning_version
+    except (OSError, ValueError):
+        return False
+
+
+def _install_cache(tmp_path, cache_path):
+    # os.replace can't replace a non-empty directory: a valid cache already there was built by another
+    # worker from the same file (and may be memory-mapped), only an outdated one is removed
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if _valid_cache(cache_path):
+            return
+        shutil.rmtree(cache_path, ignore_errors=True)
+        try:
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if not _valid_cache(cache_path):
+                raise
+
+
+def load_dataset_cache(cache_path):
+    # Returns the cached dataset with its numeric columns memory-mapped, or None if there is no valid cache
+    if not os.path.exists(os.path.join(cache_path, 'meta.json')):
+        return None
+    try:
+        with open(os.path.join(cache_path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('cleaning_version') != cleaning_version:
+            return None
+
+        index = pd.Index(np.load(os.path.join(cache_path, 'index.npy')))
+        frames = []
+        for group in meta['groups']:
+            name = group['name']
+            if group['kind'] == 'numeric':
+                block = np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')
+                # (columns, rows) on disk is the layout pandas keeps internally, so this is not copied
+                frames.append(pd.DataFrame(block.T, columns=group['columns'], index=index, copy=False))
+            else:
+                text_columns = {}
+                for column in group['columns']:
+                    codes = np.load(os.path.join(cache_path, f"{name}_{column}_codes.npy"))
+                    labels = np.load(os.path.join(cache_path, f"{name}_{column}_labels.npy")).astype(object)
+                    if group['dtype'] == 'category':
+                        text_columns[column] = pd.Categorical.from_codes(codes, categories=labels)
+                    else:
+                        text_columns[column] = pd.array(labels[codes], dtype=group['dtype'])
+                frames.append(pd.DataFrame(text_columns, index=index))
+    except (OSError, ValueError, KeyError) as error:
+        print(f"Warning: could not read the dataset cache at {cache_path}: {error}")
+        return None
+
+    # columns come back grouped by dtype, which is the CSV's order for the OWID file (country, year, numbers)
+    return pd.concat(frames, axis=1)
+
+
+def _dtype_groups(dataset):
+    groups = {}
+    for column, dtype in dataset.dtypes.items():
+        groups.setdefault(dtype, []).append(column)
+    return list(groups.items())
+
+
+def load_cleaned_dataset(file_path, cache_dir='dataset_cache', cleaned_csv_path='cleaned_dataset.csv', compact=False):
+    """
+    Returns the cleaned dataset, from the binary cache when it was built from the same source file.
+
+    :param file_path: The OWID CSV file.
+    :param cache_dir: Directory of the binary cache (shared_memory_cache_dir to keep it in shared memory).
+    :param cleaned_csv_path: Where to also save the cleaned dataset as CSV when the cache is rebuilt (None to skip).
+    :param compact: Load the smaller dataset of compact_dataset instead of the full one.
+    :return: (dataset, version): the fingerprint of the source file, with a '-compact' suffix in compact mode
+    """
+    fingerprint = source_fingerprint(file_path)
+    version = f"{fingerprint}-compact" if compact else fingerprint
+    cache_path = os.path.join(cache_dir, version)
+
+    dataset = load_dataset_cache(cache_path)
+    if dataset is not None:
+        print(f"Loaded cleaned dataset from {cache_path} ({memory_usage(dataset) / 1e6:.1f} MB)")
+        return dataset, version
+
+    dataset = clean_dataset(pd.read_csv(file_path))
+
+    # Save Cleaned Data: Save the cleaned dataset.
+    if cleaned_csv_path:
+        dataset.to_csv(cleaned_csv_path, index=False)
+
+    if compact:
+        full_size = memory_usage(dataset)
+        dataset = compact_dataset(dataset)
+        compact_size = memory_usage(dataset)
+        print(f"Compact dataset: {full_size / 1e6:.1f} MB -> {compact_size / 1e6:.1f} MB "
+              f"({1 - compact_size / full_size:.0%} saved, {len(dataset.columns)} columns kept)")
+
+    # the caches of older source files are left alone: other workers may still have them memory-mapped
+    # (they are removed with prune_dataset_cache)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_dataset_cache(dataset, cache_path)
+    print(f"Saved cleaned dataset cache to {cache_path}")
+
+    return dataset, version
+
+
+def prune_dataset_cache(cache_dir, file_path):
+    """
+    Removes the caches of other source files than file_path, and the temporary directories of
+    interrupted builds. Run it when no worker serves an older dataset any more.
+
+    :return: The removed directories.
+    """
+    fingerprint = source_fingerprint(file_path)
+    removed = []
+    for entry in sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []:
+        if entry.startswith(fingerprint) and '.tmp-' not in entry:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+        removed.append(entry)
+    return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove the dataset caches of older source files.')
+    parser.add_argument('--csv', default='owid-energy-data.csv', help='the current source file, whose caches are kept')
+    parser.add_argument('--cache-dir', default='dataset_cache')
+    args = parser.parse_args()
+    for entry in prune_dataset_cache(args.cache_dir, args.csv):
+        print(f"Removed {os.path.join(args.cache_dir, entry)}")
@@ -0,0 +1,129 @@
+import hashlib
+
+import numpy as np
+
+# Forward pass of the model built by create_lstm_model.build_lstm_model (LSTM -> Dense(1)) in plain NumPy.
+# Every array carries a leading "group" axis, so several models with the same architecture
+# (e.g. the eight energy types of one country) are evaluated together in one call.
+
+weight_names = ['kernel', 'recurrent_kernel', 'bias', 'dense_kernel', 'dense_bias']
+
+
+def lstm_weights_from_keras(model):
+    """
+    Reads the weights of a Sequential LSTM -> Dense(1) model into a dict of NumPy arrays.
+
+    :param model: A Keras model built by build_lstm_model.
+    :return: A dict with the kernel, recurrent_kernel, bias, dense_kernel and dense_bias arrays.
+    """
+    lstm_config = model.layers[0].get_config()
+    if lstm_config.get('activation') != 'tanh' or lstm_config.get('recurrent_activation') != 'sigmoid':
+        raise ValueError(f"Unsupported LSTM activations: {lstm_config.get('activation')}/{lstm_config.get('recurrent_activation')}")
+
+    weights = model.get_weights()
+    if len(weights) != len(weight_names):
+        raise ValueError(f"Expected an LSTM -> Dense model with {len(weight_names)} weight arrays, got {len(weights)}")
+
+    return {name: np.asarray(weight, dtype=np.float32) for name, weight in zip(weight_names, weights)}
+
+
+def stack_lstm_weights(weight_dicts):
+    # One array per weight name with a leading group axis; all models must have the same shapes
+    return {name: np.stack([weights[name] for weights in weight_dicts]) for name in weight_names}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def lstm_forward(stacked_weights, inputs):
+    """
+    Runs the grouped LSTM -> Dense forward pass.
+
+    :param stacked_weights: Weights from stack_lstm_weights, each with a leading group axis G.
+    :param inputs: Array of shape (G, batch, sequence_length, features).
+    :return: Array of shape (G, batch, 1).
+    """
+    kernel = stacked_weights['kernel']
+    recurrent_kernel = stacked_weights['recurrent_kernel']
+    bias = stacked_weights['bias'][:, None, :]
+    units = recurrent_kernel.shape[1]
+
+    inputs = np.asarray(inputs, dtype=np.float32)
+    groups, batch, steps, _ = inputs.shape
+    h = np.zeros((groups, batch, units), dtype=np.float32)
+    c = np.zeros((groups, batch, units), dtype=np.float32)
+
+    for t in range(steps):
+        # gate order of the Keras kernels: input, forget, cell, output
+        z = np.matmul(inputs[:, :, t, :], kernel) + np.matmul(h, recurrent_kernel) + bias
+        i = _sigmoid(z[..., :units])
+        f = _sigmoid(z[..., units:2 * units])
+        g = np.tanh(z[..., 2 * units:3 * units])
+        o = _sigmoid(z[..., 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+
+    return np.matmul(h, stacked_weights['dense_kernel']) + stacked_weights['dense_bias'][:, None, :]
+
+
+class NumpyLSTMModel:
+    # Stand-in for the loaded Keras model when serving from an exported .npz file:
+    # called like the Keras model, so predict_energy_year works with either.
+
+    def __init__(self, lstm_weights):
+        self.lstm_weights = lstm_weights
+        self._stacked = {name: weight[None] for name, weight in lstm_weights.items()}
+
+    def __call__(self, inputs, training=False):
+        return lstm_forward(self._stacked, np.asarray(inputs)[None])[0]
+
+    def predict(self, inputs, verbose=0):
+        return self(inputs)
+
+
+class NumpyMinMaxScaler:
+    # The fitted parameters of a single-feature sklearn MinMaxScaler, without importing sklearn
+
+    def __init__(self, scale, offset):
+        self.scale_ = np.asarray(scale, dtype=float)
+        self.min_ = np.asarray(offset, dtype=float)
+
+    def transform(self, values):
+        return np.asarray(values, dtype=float) * self.scale_ + self.min_
+
+    def inverse_transform(self, values):
+        return (np.asarray(values, dtype=float) - self.min_) / self.scale_
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def save_numpy_model(path, lstm_weights, scaler, source_path=None):
+    # source_sha256 records which .h5 file the weights came from, so a stale export can be detected
+    source_sha256 = file_sha256(source_path) if source_path else ''
+    np.savez(path, scaler_scale=np.asarray(scaler.scale_, dtype=float), scaler_min=np.asarray(scaler.min_, dtype=float),
+             source_sha256=np.array(source_sha256), **lstm_weights)
+
+
+def load_numpy_model(path, source_path=None):
+    """
+    Loads a model and scaler exported by export_numpy_weights.
+
+    :param source_path: If given, the .h5 file the export must have been made from.
+    :return: (NumpyLSTMModel, NumpyMinMaxScaler), or (None, None) if the file can't be read or is stale.
+    """
+    try:
+        with np.load(path) as exported:
+            if source_path and str(exported['source_sha256']) != file_sha256(source_path):
+                print(f"Warning: {path} was exported from a different version of {source_path}")
+                return None, None
+            lstm_weights = {name: exported[name] for name in weight_names}
+            scaler = NumpyMinMaxScaler(exported['scaler_scale'], exported['scaler_min'])
+    except (OSError, KeyError, ValueError):
+        print(f"Error: Could not read exported model at {path}")
+        return None, None
+
+    return NumpyLSTMModel(lstm_weights), scaler
@@ -0,0 +1,193 @@
+import time
+import bisect
+import threading
+import functools
+import contextlib
+
+# Latency and size metrics of the server, in the Prometheus text format (GET /metrics).
+#
+# The slow parts of a request are wrapped in stages (stage('filter'), @timed('render'), ...); each
+# stage records its duration in the rect_stage_seconds histogram, and while a request is handled
+# (start_request / finish_request, called by the middleware in RECT.py) the stages of that request
+# are also summed up for its Server-Timing header. Stages can be nested: 'chart' includes the
+# 'filter' and 'render' of the chart it draws. Work a request hands to a pool runs with
+# stages_of(current_stages()), so its stages are counted in the request too.
+# The counters the server already keeps (model registry, response cache, ...) are exported by the
+# collectors added with add_collector: the ones that only grow as counters (rect_<prefix>_<key>_total),
+# the others (sizes, entries, ...) as gauges.
+
+latency_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+size_buckets = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+
+# name -> (help, buckets)
+histogram_metrics = {
+    'rect_request_seconds': ('Time to handle a request, by route, method and status', latency_buckets),
+    'rect_response_bytes': ('Size of the response body, by route', size_buckets),
+    'rect_stage_seconds': ('Time spent in a stage of the request handling (filter, chart, render, model_load, predict, ...)', latency_buckets),
+}
+
+_histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+_collectors = {}  # prefix -> (function returning a dict of stats, keys of its counters)
+_lock = threading.Lock()
+_request = threading.local()
+
+
+def observe(name, value, **labels):
+    # Adds a value to a histogram of histogram_metrics
+    buckets = histogram_metrics[name][1]
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def record_stage(name, seconds):
+    observe('rect_stage_seconds', seconds, stage=name)
+    stages = getattr(_request, 'stages', None)
+    if stages is not None:
+        # the stages of a request can be recorded from several threads (stages_of)
+        with _lock:
+            stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Times the block as a stage, e.g.:
+        with stage('predict'):
+            ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed(name):
+    # Decorator timing every call of a function as a stage
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_stages():
+    # The stages of the request handled by this thread (None outside a request), to hand to stages_of
+    return getattr(_request, 'stages', None)
+
+
+@contextlib.contextmanager
+def stages_of(stages):
+    """
+    Records the stages of the block into stages (the current_stages() of a request, or a dict of
+    its own) when it runs on another thread than the request, e.g. a pool rendering part of it.
+    """
+    previous = getattr(_request, 'stages', None)
+    _request.stages = stages
+    try:
+        yield stages
+    finally:
+        _request.stages = previous
+
+
+def start_request():
+    # The stages of this thread are summed up until finish_request
+    _request.stages = {}
+    _request.start = time.perf_counter()
+
+
+def finish_request(route, method, status, size=None):
+    """
+    Records the latency (and response size) of the request started by start_request on this thread.
+
+    :return: (total seconds, {stage: seconds}) of the request.
+    """
+    stages = getattr(_request, 'stages', None) or {}
+    seconds = time.perf_counter() - getattr(_request, 'start', time.perf_counter())
+    _request.stages = None
+
+    observe('rect_request_seconds', seconds, route=route, method=method, status=str(status))
+    if size is not None:
+        observe('rect_response_bytes', size, route=route)
+    return seconds, stages
+
+
+def server_timing(seconds, stages):
+    # Server-Timing header value (durations in milliseconds), e.g. 'filter;dur=0.4, render;dur=85.1, total;dur=91.0'
+    entries = [f"{name};dur={value * 1000:.1f}" for name, value in stages.items()]
+    return ', '.join(entries + [f"total;dur={seconds * 1000:.1f}"])
+
+
+def add_collector(prefix, function, counters=()):
+    """
+    Exports the numeric values of function() (e.g. registry_stats): the keys of counters (values that
+    only grow, like hits) as counters named rect_<prefix>_<key>_total, the others as gauges named rect_<prefix>_<key>.
+    """
+    _collectors[prefix] = (function, set(counters))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _bucket_text(bound):
+    return '+Inf' if bound is None else repr(float(bound))
+
+
+def prometheus_text():
+    """
+    Returns all the metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _lock:
+        histograms = {key: (list(counts), total, count) for key, (counts, total, count) in _histograms.items()}
+
+    lines = []
+    for name, (help_text, buckets) in histogram_metrics.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + [None], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels, [('le', _bucket_text(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+
+    for prefix, (function, counters) in list(_collectors.items()):
+        try:
+            stats = function()
+        except Exception as error:  # a failing collector shouldn't break the whole endpoint
+            lines.append(f"# collector {prefix} failed: {error!r}")
+            continue
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                name = f"rect_{prefix}_{key}_total"
+                lines += [f"# TYPE {name} counter", f"{name} {value}"]
+            else:
+                name = f"rect_{prefix}_{key}"
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    with _lock:
+        _histograms.clear()
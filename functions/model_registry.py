@@ -0,0 +1,246 @@
+import os
+import time
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import Future
+
+from functions.lstm_numpy import load_numpy_model, file_sha256
+from functions.metrics import timed
+
+# Keeps the (model, scaler) pairs from saved_models/ resident in the process, so a
+# prediction request doesn't pay for tf.keras.models.load_model + joblib.load every time.
+# Entries are evicted least-recently-used first once either limit is exceeded.
+# A model is loaded outside the registry lock, so the hits on other models don't wait for it;
+# concurrent requests for a model being loaded wait for that one load.
+#
+# When export_numpy_weights has written a .npz next to the .h5 file, the model is served by
+# the NumPy LSTM in lstm_numpy and TensorFlow is never imported.
+
+models_dir = 'saved_models'
+use_numpy_models = True
+max_models = 64
+# Budget is measured on the size of the model files (.npz, or .h5 + .pkl), which is a rough (lower) bound
+# of what the loaded model costs in memory
+max_bytes = 512 * 1024 * 1024
+
+_registry = OrderedDict()  # (country, energy_type) -> (model, scaler, size_in_bytes)
+_file_hashes = {}  # path -> ((size, mtime), sha256)
+_derived = {}  # name -> (model keys, value, size_in_bytes): data built from resident models, e.g. stacked weights
+_loading = {}  # (country, energy_type) -> Future of the load in progress
+_generation = 0  # bumped when the registry is cleared, so a load started before isn't added after
+_requests = Counter()  # (country, energy_type) -> requests, to find the models worth warming up (warmup.json)
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'load_waits': 0,
+    'loads': 0,
+    'numpy_loads': 0,
+    'load_failures': 0,
+    'evictions': 0,
+    'load_seconds': 0.0,
+}
+
+
+def model_paths(country_name, energy_type, base_dir=None):
+    # Path layout used by create_prediction_model.py: saved_models/<country>/<energy>/<country>_<energy>_consumption.h5
+    base_dir = base_dir or models_dir
+    model_path = os.path.join(base_dir, country_name, energy_type, f"{country_name}_{energy_type}_consumption.h5")
+    scaler_path = os.path.join(base_dir, country_name, energy_type, f"{country_name}_{energy_type}_consumption_scaler.pkl")
+    return model_path, scaler_path
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _resident_bytes():
+    return sum(entry[2] for entry in _registry.values()) + sum(entry[2] for entry in _derived.values())
+
+
+def _drop_derived(key):
+    # the data built from a model leaves the registry with it
+    for name in [name for name, entry in _derived.items() if key in entry[0]]:
+        del _derived[name]
+
+
+def _evict():
+    # always keep the entry that was just loaded, even if it alone is over the budget
+    while len(_registry) > 1 and (len(_registry) > max_models or _resident_bytes() > max_bytes):
+        key, _ = _registry.popitem(last=False)
+        _drop_derived(key)
+        _stats['evictions'] += 1
+
+
+@timed('model_load')
+def _load_model_files(model_path, scaler_path):
+    numpy_path = os.path.splitext(model_path)[0] + '.npz'
+    if use_numpy_models and os.path.exists(numpy_path):
+        model, scaler = load_numpy_model(numpy_path, source_path=model_path if os.path.exists(model_path) else None)
+        if model is not None:
+            with _lock:
+                _stats['numpy_loads'] += 1
+            return model, scaler, _file_size(numpy_path)
+
+    # no model for this country / energy type (free text from the client): answered without importing TensorFlow
+    if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+        return None, None, 0
+
+    # TensorFlow is only imported when a model has no (up to date) NumPy export
+    from functions.create_lstm_model import load_model_and_scaler
+
+    model, scaler = load_model_and_scaler(model_path, scaler_path)
+    return model, scaler, _file_size(model_path) + _file_size(scaler_path)
+
+
+def get_model_and_scaler(country_name, energy_type, count_request=True):
+    """
+    Returns the loaded model and scaler for a country and energy type, loading them from
+    saved_models/ only the first time they are requested.
+
+    :param count_request: False for a load that isn't a request (the warm-up), left out of most_requested.
+    :return: (model, scaler), or (None, None) if the files could not be loaded.
+    """
+    key = (country_name, energy_type)
+    with _lock:
+        if count_request:
+            _requests[key] += 1
+        entry = _registry.get(key)
+        if entry is not None:
+            _registry.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[0], entry[1]
+
+        loading = _loading.get(key)
+        if loading is None:
+            loading = _loading[key] = Future()
+            generation = _generation
+            _stats['misses'] += 1
+            model_path, scaler_path = model_paths(country_name, energy_type)
+        else:
+            _stats['load_waits'] += 1
+            generation = None
+
+    if generation is None:
+        # another thread is loading this model
+        return loading.result()
+
+    start = time.perf_counter()
+    try:
+        model, scaler, size = _load_model_files(model_path, scaler_path)
+    except BaseException as error:
+        with _lock:
+            _loading.pop(key, None)
+        loading.set_exception(error)
+        raise
+
+    with _lock:
+        _stats['load_seconds'] += time.perf_counter() - start
+        if model is None or scaler is None:
+            # not cached, so a model trained later is picked up without a restart
+            _stats['load_failures'] += 1
+            model, scaler = None, None
+        else:
+            _stats['loads'] += 1
+            if generation == _generation:
+                _registry[key] = (model, scaler, size)
+                _evict()
+        if _loading.get(key) is loading:
+            del _loading[key]
+    loading.set_result((model, scaler))
+    return model, scaler
+
+
+def _resident(keys, models):
+    return all(key in _registry and _registry[key][0] is model for key, model in zip(keys, models))
+
+
+def get_derived(name, keys, models, build):
+    """
+    Returns data built from resident models (e.g. their stacked weights), kept in the registry while
+    these models stay loaded: it counts in max_bytes and is dropped when one of them is evicted or reloaded.
+
+    :param keys: The (country, energy_type) of the models.
+    :param models: The models, as returned by get_model_and_scaler.
+    :param build: Function returning (value, size_in_bytes), called when there is no current value.
+    """
+    keys = tuple(keys)
+    with _lock:
+        entry = _derived.get(name)
+        if entry is not None and entry[0] == keys and _resident(keys, models):
+            return entry[1]
+
+    value, size = build()
+    with _lock:
+        # not kept if one of the models was evicted (or replaced) meanwhile
+        if _resident(keys, models):
+            _derived[name] = (keys, value, size)
+            _evict()
+    return value
+
+
+def model_version(country_name, energy_type):
+    """
+    Returns the sha256 of the model file of a country and energy type (the .h5, or the .npz export
+    when there is no .h5), or None if there is no model. Hashes are remembered until the file changes.
+    """
+    model_path, _ = model_paths(country_name, energy_type)
+    for path in (model_path, os.path.splitext(model_path)[0] + '.npz'):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with _lock:
+            cached = _file_hashes.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = file_sha256(path)
+        with _lock:
+            _file_hashes[path] = (signature, digest)
+        return digest
+    return None
+
+
+def _clear():
+    global _generation
+    _registry.clear()
+    _derived.clear()
+    _loading.clear()
+    _generation += 1
+
+
+def configure_registry(max_resident_models=None, max_resident_bytes=None, saved_models_dir=None):
+    global max_models, max_bytes, models_dir
+    with _lock:
+        if max_resident_models is not None:
+            max_models = max_resident_models
+        if max_resident_bytes is not None:
+            max_bytes = max_resident_bytes
+        if saved_models_dir is not None:
+            models_dir = saved_models_dir
+            _clear()
+        _evict()
+
+
+def clear_registry():
+    with _lock:
+        _clear()
+
+
+def registry_stats():
+    """
+    Returns the registry counters (hits, misses, loads, evictions, total load time),
+    what is currently resident and the most requested models.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['resident_models'] = len(_registry)
+        stats['resident_bytes'] = _resident_bytes()
+        stats['derived_bytes'] = sum(entry[2] for entry in _derived.values())
+        stats['resident'] = [f"{country}/{energy_type}" for country, energy_type in _registry]
+        stats['most_requested'] = {f"{country}/{energy_type}": count for (country, energy_type), count in _requests.most_common(10)}
+    return stats
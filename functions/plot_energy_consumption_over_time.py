@@ -1,17 +1,15 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import pandas as pd
-from functions.save_plot import save_plot
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
+from functions.dataset_index import country_rows
+from functions.load_cleaned_dataset import source_values
 
-def plot_energy_consumption_over_time(data, country=None, start_year=None, end_year=None, energy_types=None ):
+def plot_energy_consumption_over_time(data, country=None, start_year=None, end_year=None, energy_types=None, output='html', dpi=None):
     
     if not country:
         country = 'World'
         
-    plt.figure(figsize=(12, 6))
-
-    data = data[data['country'] == country]
+    data = country_rows(data, country)
 
     if start_year:
         data = data[data['year'] >= start_year]
@@ -21,12 +19,22 @@ def plot_energy_consumption_over_time(data, country=None, start_year=None, end_y
 
     if energy_types is None:
         energy_types = ['biofuel_consumption', 'hydro_consumption', 'solar_consumption', 'wind_consumption']
+    data = source_values(data[['year'] + list(energy_types)])
+
+    energy_consumption_over_time_data = {
+    'year': data['year'].tolist(),
+    'consumption': data[energy_types[-1]].tolist()
+    }
+    if output == 'data':
+        return {"data": energy_consumption_over_time_data}
+
+    fig, ax = new_figure('energy_consumption_over_time')
 
     for energy_type in energy_types:
-        plt.plot(data['year'], data[energy_type], label=energy_type)
+        ax.plot(data['year'], data[energy_type], label=energy_type)
 
-    plt.xlabel('Year')
-    plt.ylabel('Energy Consumption (units depend on your data)')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Energy Consumption (units depend on your data)')
     title = f'Renewable Energy Consumption Over Time ({country or "Global"})'
     if start_year and end_year:
         title += f' ({start_year}-{end_year})'
@@ -35,15 +43,9 @@ def plot_energy_consumption_over_time(data, country=None, start_year=None, end_y
     elif end_year:
         title += f' (Up to {end_year})'
 
-    plt.title(title)
-    plt.legend()
-    plt.grid(True)
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True)
 
-    plot_url = save_plot(plt)
-   
-    energy_consumption_over_time_data = {
-    'year': data['year'].tolist(),
-    'consumption': data[energy_type].tolist()
-    }
-    # Return the plot as an HTML <img> tag
-    return {"data": energy_consumption_over_time_data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
+    # Return the plot as an HTML <img> tag (or the raw image)
+    return plot_output(fig, energy_consumption_over_time_data, output, dpi)
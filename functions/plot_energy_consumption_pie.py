@@ -1,37 +1,37 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from functions.save_plot import save_plot
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
+from functions.dataset_index import country_year_rows
+from functions.load_cleaned_dataset import source_values
 
 # Plots a pie chart for energy consumption by source for a specific country and year.
-def plot_energy_consumption_pie(data, energy_sources, country_name, year, pie_title = 'Energy Consumption'):
+def plot_energy_consumption_pie(data, energy_sources, country_name, year, pie_title = 'Energy Consumption', output='html', dpi=None):
 
     # Filter the dataset for the given country and year
-    country_year_data = data[(data['country'] == country_name) & (data['year'] == year)]
+    country_year_data = country_year_rows(data, country_name, year)
 
     # Check if data for the country and year exists
     if country_year_data.empty:
         raise ValueError(f"No data available for {country_name} in {year}.")
 
     # Calculate the total consumption for each energy source
-    energy_consumption = country_year_data[energy_sources].sum()
+    energy_consumption = source_values(country_year_data[energy_sources]).sum()
 
-    # Plot the pie chart
-    plt.figure(figsize=(8, 8))
-    wedges, texts, autotexts = plt.pie(energy_consumption, labels=None, autopct='%1.1f%%', startangle=90, textprops={'color': 'black'})
-
-    # Create the legend (key map) outside the pie chart
-    plt.legend(wedges, energy_sources, title="Energy Sources", loc="center left", bbox_to_anchor=(1, 0.5))
-
-    plt.title(f'{pie_title}Energy Consumption by Source in {country_name} ({year})')
-    plt.grid(True)
-    
-    plot_url = save_plot(plt)
-    
     consumption_data = {
         'energy_sources': energy_sources,
         'consumption': energy_consumption.tolist()
     }
+    if output == 'data':
+        return {"data": consumption_data}
+
+    # Plot the pie chart
+    fig, ax = new_figure('energy_consumption_pie')
+    wedges, texts, autotexts = ax.pie(energy_consumption, labels=None, autopct='%1.1f%%', startangle=90, textprops={'color': 'black'})
+
+    # Create the legend (key map) outside the pie chart
+    ax.legend(wedges, energy_sources, title="Energy Sources", loc="center left", bbox_to_anchor=(1, 0.5))
+
+    ax.set_title(f'{pie_title}Energy Consumption by Source in {country_name} ({year})')
+    ax.grid(True)
     
-    # Return the plot as an HTML <img> tag
-    return {"data": consumption_data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
+    # Return the plot as an HTML <img> tag (or the raw image)
+    return plot_output(fig, consumption_data, output, dpi)
@@ -1,14 +1,8 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
 from functions.filter_energy_data import filter_energy_data
-from functions.save_plot import save_plot
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
 
-def plot_energy_consumption_trend(dataset, country_name, start_year=None, end_year=None):
-    # Define the country and time period
-    country_data, new_start_year, new_end_year = filter_energy_data(dataset, country_name, start_year, end_year)
-    
+def plot_energy_consumption_trend(dataset, country_name, start_year=None, end_year=None, filtered_data=None, output='html', dpi=None):
     # List of columns to plot
     consumption_columns = [
         'renewables_consumption', 'coal_consumption', 'biofuel_consumption',
@@ -16,18 +10,10 @@ def plot_energy_consumption_trend(dataset, country_name, start_year=None, end_ye
         'nuclear_consumption', 'oil_consumption', 'wind_consumption', 'solar_consumption'
     ]
 
-    plt.figure(figsize=(12, 7))
-
-    # Plot each column
-    for column in consumption_columns:
-        plt.plot(country_data['year'], country_data[column], label=column.replace('_', ' ').title())
-
-    plt.xlabel('Year')
-    plt.ylabel('Consumption (TWh)')
-    plt.legend()
-    plt.title(f'Energy Consumption Trends in {country_name}')
-    
-    plot_url = save_plot(plt)
+    # Define the country and time period (only the columns used here), unless the caller already did (e.g. once for a batch of charts)
+    if filtered_data is None:
+        filtered_data = filter_energy_data(dataset, country_name, start_year, end_year, columns=['year'] + consumption_columns)
+    country_data, new_start_year, new_end_year = filtered_data
     
     plot_data = {}
 
@@ -37,6 +23,19 @@ def plot_energy_consumption_trend(dataset, country_name, start_year=None, end_ye
             'year': country_data['year'].tolist(),
             'consumption': country_data[column].tolist()
         }
-        
-    # Return the plot as an HTML <img> tag
-    return {"data": plot_data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
\ No newline at end of file
+    if output == 'data':
+        return {"data": plot_data}
+
+    fig, ax = new_figure('energy_consumption_trend')
+
+    # Plot each column
+    for column in consumption_columns:
+        ax.plot(country_data['year'], country_data[column], label=column.replace('_', ' ').title())
+
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Consumption (TWh)')
+    ax.legend()
+    ax.set_title(f'Energy Consumption Trends in {country_name}')
+    
+    # Return the plot as an HTML <img> tag (or the raw image)
+    return plot_output(fig, plot_data, output, dpi)
@@ -1,36 +1,33 @@
-import io, os
-import base64
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
-from functions.save_plot import save_plot
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
 
 from functions.filter_energy_data import filter_energy_data
 
 # Function to plot the relationship between year and solar electricity for a specific country
-def plot_energy_type(dataset, country_name, energy_type = 'solar_electricity',start_year=None, end_year=None):
-    # Filter the data for the specific country
-    country_data, new_start_year, new_end_year = filter_energy_data(dataset, country_name, start_year, end_year)
-    
-    # Plot the data
-    plt.figure(figsize=(10, 6))
-    plt.plot(country_data['year'], country_data[energy_type], marker='o')
-    plt.xlabel('Year')
-    plt.ylabel('(TWh)')
-    title = f'{energy_type} for {country_name}'
-    if start_year is not None and end_year is not None:
-        title = f'{energy_type} ({new_start_year}-{new_end_year}) for {country_name}'
-    plt.title(title)
-    plt.grid(True)
-    
-    # Save the plot to a bytes object and encode it as a base64 string
-    plot_url = save_plot(plt)
+def plot_energy_type(dataset, country_name, energy_type = 'solar_electricity',start_year=None, end_year=None, filtered_data=None, output='html', dpi=None):
+    # Filter the data for the specific country (year and energy_type only), unless the caller already did (e.g. once for a batch of charts)
+    if filtered_data is None:
+        filtered_data = filter_energy_data(dataset, country_name, start_year, end_year, columns=['year', energy_type])
+    country_data, new_start_year, new_end_year = filtered_data
     
     energy_type_data = {
         'year': country_data['year'].tolist(),
         'consumption': country_data[energy_type].tolist()
     }
-    # Return the plot as an HTML <img> tag
     print(energy_type_data)
-    return {"data": energy_type_data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
\ No newline at end of file
+    if output == 'data':
+        return {"data": energy_type_data}
+
+    # Plot the data
+    fig, ax = new_figure('energy_type')
+    ax.plot(country_data['year'], country_data[energy_type], marker='o')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('(TWh)')
+    title = f'{energy_type} for {country_name}'
+    if start_year is not None and end_year is not None:
+        title = f'{energy_type} ({new_start_year}-{new_end_year}) for {country_name}'
+    ax.set_title(title)
+    ax.grid(True)
+    
+    # Save the plot to a bytes object (as an <img> tag with a base64 string, unless output asks for the raw image)
+    return plot_output(fig, energy_type_data, output, dpi)
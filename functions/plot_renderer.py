@@ -0,0 +1,81 @@
+import io
+import json
+import threading
+
+from functions.metrics import timed
+
+# Renders the plots with matplotlib's object-oriented API (Figure + Agg canvas) instead of the
+# pyplot state machine. Nothing is global: every thread draws on its own figures, so plots can
+# be rendered concurrently (threaded Flask, thread pools) without bleeding into each other.
+# Each thread keeps one figure per chart type and clears it for the next plot instead of
+# creating and registering a new figure on every request.
+# matplotlib is imported with the first figure, so importing the server doesn't pay for it.
+
+# Figure size (inches) of each chart type
+figure_templates = {
+    'energy_type': {'figsize': (10, 6)},
+    'energy_consumption_pie': {'figsize': (8, 8)},
+    'renewable_vs_non': {'figsize': (12, 7)},
+    'energy_consumption_trend': {'figsize': (12, 7)},
+    'energy_consumption_over_time': {'figsize': (12, 6)},
+    'renewable_energy_sources_over_time': {'figsize': (12, 6)},
+}
+default_template = {'figsize': (10, 6)}
+
+# Resolution of the rendered images, and of the small previews (thumbnails)
+render_settings = {'dpi': 100, 'thumbnail_dpi': 40}
+
+_figures = threading.local()
+
+
+def new_figure(chart_type):
+    """
+    Returns a cleared figure and its axes for a chart type, reusing the figure this thread
+    drew the previous chart of that type on.
+
+    :return: (Figure, Axes)
+    """
+    template = figure_templates.get(chart_type, default_template)
+    figures = getattr(_figures, 'by_type', None)
+    if figures is None:
+        figures = _figures.by_type = {}
+
+    fig = figures.get(chart_type)
+    if fig is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=template['figsize'], dpi=render_settings['dpi'])
+        FigureCanvasAgg(fig)
+        figures[chart_type] = fig
+    else:
+        fig.clear()
+        fig.set_size_inches(template['figsize'])
+        fig.set_dpi(render_settings['dpi'])
+
+    return fig, fig.add_subplot()
+
+
+@timed('render')
+def render_figure(fig, image_format='png', dpi=None):
+    # The figure as image bytes (png, svg, ...)
+    image = io.BytesIO()
+    # no creation date in the svg metadata, so the same chart always gives the same bytes (and ETag)
+    metadata = {'Date': None} if image_format == 'svg' else None
+    fig.savefig(image, format=image_format, bbox_inches='tight', dpi=dpi or render_settings['dpi'], metadata=metadata)
+    return image.getvalue()
+
+
+def configure_rendering(dpi=None, templates=None, thumbnail_dpi=None):
+    # Changes the resolution and/or the figure sizes of chart types, e.g. templates={'energy_type': {'figsize': (8, 5)}}
+    if dpi is not None:
+        render_settings['dpi'] = dpi
+    if thumbnail_dpi is not None:
+        render_settings['thumbnail_dpi'] = thumbnail_dpi
+    for chart_type, template in (templates or {}).items():
+        figure_templates[chart_type] = {**figure_templates.get(chart_type, default_template), **template}
+
+
+def rendering_signature():
+    # Changes whenever the rendering settings do, so cached images can be keyed on it
+    return json.dumps([render_settings, figure_templates], sort_keys=True)
@@ -1,33 +1,34 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import pandas as pd
-from functions.save_plot import save_plot
-
-def plot_renewable_energy_sources_over_time(data, start_year=None):
-    plt.figure(figsize=(12, 6))
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
+from functions.load_cleaned_dataset import source_values
 
+def plot_renewable_energy_sources_over_time(data, start_year=None, output='html', dpi=None):
     if start_year:
         data = data[data['year'] >= start_year]
 
     energy_types = ['solar_consumption', 'wind_consumption', 'hydro_consumption']
-    
+    data = source_values(data[['year'] + energy_types])
+
+    renewable_energy_sources_over_time = {
+    'year': data['year'].tolist(),
+    'consumption': data[energy_types[-1]].tolist()
+    }
+    if output == 'data':
+        return {"data": renewable_energy_sources_over_time}
+
     renewable_data = data.groupby('year')[['solar_consumption', 'wind_consumption', 'hydro_consumption']].sum().reset_index()
 
+    fig, ax = new_figure('renewable_energy_sources_over_time')
+
     for energy_type in energy_types:
-        plt.plot(renewable_data['year'], renewable_data[energy_type], label=energy_type)
+        ax.plot(renewable_data['year'], renewable_data[energy_type], label=energy_type)
 
-    plt.title('Share of Renewable Energy Sources Over Time')
-    plt.xlabel('Year')
-    plt.ylabel('Energy Consumption (TWh)')
-    plt.legend()
-    plt.grid(True)
+    ax.set_title('Share of Renewable Energy Sources Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Energy Consumption (TWh)')
+    ax.legend()
+    ax.grid(True)
 
-    plot_url = save_plot(plt)
-    
-    renewable_energy_sources_over_time = {
-    'year': data['year'].tolist(),
-    'consumption': data[energy_type].tolist()
-    }
-    # Return the plot as an HTML <img> tag
-    return {"data": renewable_energy_sources_over_time, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
+    # Return the plot as an HTML <img> tag (or the raw image)
+    return plot_output(fig, renewable_energy_sources_over_time, output, dpi)
@@ -1,42 +1,41 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
 from functions.filter_energy_data import filter_energy_data
-from functions.save_plot import save_plot
-
-def plot_renewable_vs_non(dataset, country_name, start_year=None, end_year=None):
-    # Define the country and time period
-    country_data, new_start_year, new_end_year = filter_energy_data(dataset, country_name, start_year, end_year)
-    print(country_data)
+from functions.save_plot import plot_output
+from functions.plot_renderer import new_figure
 
+def plot_renewable_vs_non(dataset, country_name, start_year=None, end_year=None, filtered_data=None, output='html', dpi=None):
     # Define renewable and non-renewable energy sources
     renewable_sources = ['wind_consumption', 'solar_consumption', 'hydro_consumption', 'biofuel_consumption']
     non_renewable_sources = ['coal_consumption', 'oil_consumption', 'gas_consumption', 'nuclear_consumption', 'fossil_fuel_consumption']
 
-    # Create new columns for summed values
-    country_data['renewable_energy'] = country_data[renewable_sources].sum(axis=1)
-    country_data['non_renewable_energy'] = country_data[non_renewable_sources].sum(axis=1)
+    # Define the country and time period (only the columns used here), unless the caller already did (e.g. once for a batch of charts)
+    if filtered_data is None:
+        filtered_data = filter_energy_data(dataset, country_name, start_year, end_year, columns=['year'] + renewable_sources + non_renewable_sources)
+    country_data, new_start_year, new_end_year = filtered_data
+    print(country_data)
 
-    # Plot renewable vs non-renewable energy
-    plt.figure(figsize=(12, 7))
-    plt.plot(country_data['year'], country_data['renewable_energy'], label='Renewable Energy', color='green', linewidth=2)
-    plt.plot(country_data['year'], country_data['non_renewable_energy'], label='Non-Renewable Energy', color='red', linewidth=2)
+    # Summed values (kept apart from country_data, which may be shared with other charts)
+    renewable_energy = country_data[renewable_sources].sum(axis=1)
+    non_renewable_energy = country_data[non_renewable_sources].sum(axis=1)
 
-    # Labels and title
-    plt.xlabel('Year')
-    plt.ylabel('Consumption (TWh)')
-    plt.legend()
-    plt.title(f'Renewable vs Non-Renewable Energy in {country_name} ({new_start_year}-{new_end_year})')
-    plt.grid(True)
-    
-    # Save the plot to a bytes object and encode it as a base64 string
-    plot_url = save_plot(plt)
-    
     energy_comparison_data = {
         'year': country_data['year'].tolist(),
-        'renewable_energy': country_data['renewable_energy'].tolist(),
-        'non_renewable_energy': country_data['non_renewable_energy'].tolist()
+        'renewable_energy': renewable_energy.tolist(),
+        'non_renewable_energy': non_renewable_energy.tolist()
     }
-    # Return the plot as an HTML <img> tag
-    return {"data": energy_comparison_data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
\ No newline at end of file
+    if output == 'data':
+        return {"data": energy_comparison_data}
+
+    # Plot renewable vs non-renewable energy
+    fig, ax = new_figure('renewable_vs_non')
+    ax.plot(country_data['year'], renewable_energy, label='Renewable Energy', color='green', linewidth=2)
+    ax.plot(country_data['year'], non_renewable_energy, label='Non-Renewable Energy', color='red', linewidth=2)
+
+    # Labels and title
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Consumption (TWh)')
+    ax.legend()
+    ax.set_title(f'Renewable vs Non-Renewable Energy in {country_name} ({new_start_year}-{new_end_year})')
+    ax.grid(True)
+    
+    # Return the plot as an HTML <img> tag (or the raw image)
+    return plot_output(fig, energy_comparison_data, output, dpi)
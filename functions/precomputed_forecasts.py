@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+# use the sys path, so the functions package can be imported when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.forecast_store import lookup_forecast, forecast_saved_models, configure_forecast_store, save_forecast
+from functions.metrics import timed
+
+# Forecasts of every saved model, computed right after training and written to one .npz file
+# (one row of yearly predictions per country and energy type). The prediction routes answer from
+# it first; a model or dataset that changed since it was written (compared by the model file's
+# sha256 and the dataset version), or a year beyond its horizon, falls back to the forecast store
+# and then to live inference.
+#
+# This is the one offline precompute: --store also saves the trajectories in the forecast store
+# (the fallback of the artifact, which keeps serving when the artifact is stale for some models).
+#     python functions/precomputed_forecasts.py --until 2035 [--store forecast_store.sqlite3]
+# or, after training: python create_prediction_model.py --precompute-until 2035
+
+artifact_path = os.path.join('saved_models', 'precomputed_forecasts.npz')
+
+_lock = threading.Lock()
+_loaded = {'signature': None, 'artifact': None}
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stale': 0,
+}
+
+
+def precompute_forecasts(data, dataset_version, until_year, models_dir='saved_models', countries=None, energy_types=None, sequence_length=5,
+                         fill_store=False):
+    """
+    Rolls every saved model forward to until_year with the batched inference (forecast_saved_models).
+    Every trajectory is computed again, the current artifact and the store are not read.
+
+    :param fill_store: Also save the trajectories in the forecast store (configure_forecast_store).
+    :return: The arrays of the artifact, see write_forecast_artifact.
+    """
+    from functions.model_registry import model_version
+
+    pairs, versions, first_years, trajectories = [], [], [], []
+    for country, forecasts in forecast_saved_models(data, until_year, models_dir, countries, energy_types, sequence_length):
+        for energy_type, predictions in forecasts.items():
+            # nothing to store for a missing model or too short a history: those stay live
+            if not isinstance(predictions, list) or not predictions:
+                continue
+            pairs.append((country, energy_type))
+            versions.append(model_version(country, energy_type))
+            if fill_store:
+                save_forecast(country, energy_type, versions[-1], dataset_version, predictions, sequence_length)
+            first_years.append(predictions[0]['year'])
+            trajectories.append([prediction['prediction'] for prediction in predictions])
+
+    horizon = max((len(trajectory) for trajectory in trajectories), default=0)
+    predictions = np.full((len(trajectories), horizon), np.nan)
+    for row, trajectory in enumerate(trajectories):
+        predictions[row, :len(trajectory)] = trajectory
+
+    return {
+        'pairs': np.array(pairs, dtype=str).reshape(-1, 2),
+        'model_versions': np.array(versions, dtype=str),
+        'first_years': np.array(first_years, dtype=np.int32),
+        'last_years': np.array([first + len(trajectory) - 1 for first, trajectory in zip(first_years, trajectories)], dtype=np.int32),
+        'predictions': predictions,
+        'dataset_version': np.array(str(dataset_version)),
+        'sequence_length': np.array(sequence_length),
+        'created_at': np.array(time.time()),
+    }
+
+
+def write_forecast_artifact(path, arrays):
+    # written next to the final file and renamed, so the server never reads a half-written artifact
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+class ForecastArtifact:
+
+    def __init__(self, path):
+        with np.load(path) as arrays:
+            self.dataset_version = str(arrays['dataset_version'])
+            self.sequence_length = int(arrays['sequence_length'])
+            self.predictions = arrays['predictions']
+            self.first_years = arrays['first_years']
+            self.last_years = arrays['last_years']
+            self.model_versions = arrays['model_versions']
+            self.rows = {(str(country), str(energy_type)): row for row, (country, energy_type) in enumerate(arrays['pairs'])}
+
+    def lookup(self, country, energy_type, model_version, dataset_version, prediction_year, sequence_length=5):
+        # The predictions up to prediction_year (as returned by predict_energy_year), or None
+        row = self.rows.get((country, energy_type))
+        if row is None or prediction_year > self.last_years[row]:
+            return None, False
+        if (str(dataset_version) != self.dataset_version or sequence_length != self.sequence_length
+                or model_version != self.model_versions[row]):
+            return None, True
+
+        first_year = int(self.first_years[row])
+        return [
+            {'country': country, 'year': year, 'energy_type': energy_type + '_consumption', 'prediction': float(self.predictions[row, step])}
+            for step, year in enumerate(range(first_year, prediction_year + 1))
+        ], False
+
+
+def _artifact():
+    # the artifact at artifact_path, reloaded when the file is rewritten
+    try:
+        stat = os.stat(artifact_path)
+    except OSError:
+        return None
+    signature = (artifact_path, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if _loaded['signature'] == signature:
+            return _loaded['artifact']
+    try:
+        artifact = ForecastArtifact(artifact_path)
+    except (OSError, ValueError, KeyError) as error:
+        print(f"Warning: could not read the precomputed forecasts at {artifact_path}: {error}")
+        artifact = None
+    with _lock:
+        _loaded.update(signature=signature, artifact=artifact)
+    return artifact
+
+
+def lookup_precomputed(country, energy_type, model_version, dataset_version, prediction_year, sequence_length=5):
+    artifact = _artifact()
+    if artifact is None or model_version is None:
+        return None
+    predictions, stale = artifact.lookup(country, energy_type, model_version, dataset_version, prediction_year, sequence_length)
+    with _lock:
+        _stats['hits' if predictions is not None else 'stale' if stale else 'misses'] += 1
+    return predictions
+
+
+@timed('forecast_lookup')
+def known_forecast(country, energy_type, model_version, dataset_version, prediction_year, sequence_length=5):
+    """
+    Returns the forecast of a model up to prediction_year from the precomputed artifact or else the
+    forecast store, or None if it has to be computed.
+    """
+    predictions = lookup_precomputed(country, energy_type, model_version, dataset_version, prediction_year, sequence_length)
+    if predictions is not None:
+        return predictions
+    return lookup_forecast(country, energy_type, model_version, dataset_version, prediction_year, sequence_length)
+
+
+def configure_precomputed_forecasts(path=None):
+    global artifact_path
+    if path is not None:
+        artifact_path = path
+
+
+def precomputed_stats():
+    artifact = _artifact()
+    with _lock:
+        stats = dict(_stats)
+    stats['path'] = artifact_path
+    if artifact is not None:
+        stats.update(trajectories=len(artifact.rows), dataset_version=artifact.dataset_version)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the forecasts of all saved models (and pre-fill the forecast store).')
+    parser.add_argument('--until', type=int, required=True, help='last year to predict')
+    parser.add_argument('--csv', default='owid-energy-data.csv')
+    parser.add_argument('--compact', action='store_true', help='use the compact dataset (when the server runs with DATASET_COMPACT=1)')
+    parser.add_argument('--models-dir', default='saved_models')
+    parser.add_argument('--output', default=None, help='defaults to <models-dir>/precomputed_forecasts.npz')
+    parser.add_argument('--store', default=None, help='also save the trajectories in this forecast store (e.g. forecast_store.sqlite3)')
+    parser.add_argument('--countries', nargs='*')
+    parser.add_argument('--energy-types', nargs='*')
+    parser.add_argument('--sequence-length', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from functions.load_cleaned_dataset import load_cleaned_dataset
+    from functions.model_registry import configure_registry
+
+    configure_registry(saved_models_dir=args.models_dir)
+    if args.store:
+        configure_forecast_store(args.store)
+    dataset, dataset_version = load_cleaned_dataset(args.csv, compact=args.compact)
+
+    start = time.perf_counter()
+    arrays = precompute_forecasts(dataset, dataset_version, args.until, args.models_dir, args.countries,
+                                  args.energy_types, args.sequence_length, fill_store=bool(args.store))
+    output = args.output or os.path.join(args.models_dir, 'precomputed_forecasts.npz')
+    write_forecast_artifact(output, arrays)
+    print(f"Precomputed {len(arrays['pairs'])} forecasts up to {args.until} in {output}"
+          f"{f' and {args.store}' if args.store else ''} ({time.perf_counter() - start:.1f} s)")
+    return output
+
+
+if __name__ == '__main__':
+    main()
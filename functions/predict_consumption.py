@@ -1,21 +1,29 @@
 
-import os
 from functions.load_and_process_data import load_and_preprocess_data
-from functions.create_lstm_model import load_model_and_scaler
+from functions.model_registry import get_model_and_scaler, model_version
 from functions.predict_energy_year import predict_energy_year
+from functions.forecast_store import save_forecast
+from functions.precomputed_forecasts import known_forecast
 
-def predict_consumption(country_name, prediction_year, energy_type, csv_file_path, sequence_length = 5):
+def predict_consumption(country_name, prediction_year, energy_type, csv_file_path, sequence_length = 5, data = None, dataset_version = None):
     
-    # Load and Preprocess Data
-    energy_data = load_and_preprocess_data(csv_file_path, (energy_type+'_consumption'))
+    # Precomputed or stored result of the same model on the same dataset, when the dataset version is known
+    if dataset_version is not None:
+        version = model_version(country_name, energy_type)
+        stored = known_forecast(country_name, energy_type, version, dataset_version, prediction_year, sequence_length)
+        if stored is not None:
+            return stored
+
+    # Load and Preprocess Data, unless the caller already has the cleaned dataset in memory
+    if data is None:
+        energy_data = load_and_preprocess_data(csv_file_path, (energy_type+'_consumption'))
+    else:
+        energy_data = data
     if energy_data is None:
         return 'Energy data is none'
     
-    # Load Model and Scaler
-    model_save_path = os.path.join("saved_models", country_name, energy_type, f"{country_name}_{energy_type}_consumption.h5")
-    scaler_save_path = os.path.join("saved_models", country_name, energy_type, f"{country_name}_{energy_type}_consumption_scaler.pkl")
-    
-    loaded_model, loaded_scaler = load_model_and_scaler(model_save_path, scaler_save_path)
+    # Load Model and Scaler (kept resident by the model registry after the first request)
+    loaded_model, loaded_scaler = get_model_and_scaler(country_name, energy_type)
 
     
     # loaded_model, loaded_scaler = load_model_and_scaler((country_name + '_' + energy_type+'_consumption')+'.h5', country_name + '_' + energy_type+'_consumption_scaler.pkl')
@@ -27,6 +35,9 @@ def predict_consumption(country_name, prediction_year, energy_type, csv_file_pat
     predicted_consumption = predict_energy_year(loaded_model, loaded_scaler, energy_data, country_name, prediction_year, sequence_length, energy_type)
     print(predicted_consumption)
 
+    if dataset_version is not None:
+        save_forecast(country_name, energy_type, version, dataset_version, predicted_consumption, sequence_length)
+
     return predicted_consumption
 
 
@@ -1,40 +1,66 @@
 import numpy as np
-import pandas as pd
 
-def predict_energy_year(model, scaler, data, country, prediction_year, sequence_length, target_column):
+from functions.dataset_index import country_rows
+from functions.metrics import timed
+
+@timed('predict')
+def forecast_energy_years(model, scaler, data, country, prediction_year, sequence_length, target_column):
+    """
+    Rolls the model forward from the last known year of a country up to prediction_year
+    and returns the prediction for every year on the way, in one pass.
+
+    The last sequence_length (scaled) values are kept in a small ring buffer, so each step
+    only writes the new prediction into it instead of filtering and growing the DataFrame.
+
+    :return: A list of {'country', 'year', 'energy_type', 'prediction'} dicts, one per year,
+             or None if the country doesn't have sequence_length years of history.
+    """
     target_column = target_column + '_consumption'
-    # Get the last year for the country
-    last_known_year = data[data['country'] == country]['year'].max() 
+    # the country's rows, already sorted by year
+    country_data = country_rows(data, country)
+    if country_data.empty:
+        print(f"Error: Not enough historical data for {country} to make a prediction.")
+        return None
 
-    # if LSTM model predict only the next step value, if there are many steps to reach the required year
-    # the model should calculate all the steps till reach the required year
-    predictions = []
+    last_known_year = int(country_data['year'].iloc[-1])
+    history = country_data[target_column].to_numpy(dtype=float)[-sequence_length:]
 
-    for year in range(last_known_year + 1, prediction_year + 1):
-        
-        # i got an error: ValueError: cannot reshape array of size 124 into shape (1,5,1)
-        # solved by .tail, as the data has a 
-        country_data_hist = data[(data['country'] == country) & (data['year'] < year)].sort_values(by='year').tail(sequence_length)
+    if prediction_year > last_known_year and len(history) < sequence_length:
+        print(f"Error: Not enough historical data for {country} before {last_known_year + 1} to make a prediction.")
+        return None
 
-        if len(country_data_hist) < sequence_length:
-            print(f"Error: Not enough historical data for {country} before {year} to make a prediction.")
-            return None
+    # MinMaxScaler.transform / inverse_transform, without sklearn's per-call validation
+    scale, offset = scaler.scale_[0], scaler.min_[0]
+    ring = history * scale + offset
+    head = 0  # position of the oldest value in the ring
+    order = np.arange(sequence_length)
 
-        input_sequence = scaler.transform(country_data_hist[[target_column]]) 
-        input_sequence = np.array([input_sequence])
-        input_sequence = input_sequence.reshape(1, sequence_length, 1) 
+    input_sequence = np.empty((1, sequence_length, 1), dtype=np.float32)
+    predictions = []
 
-        predicted_scaled_value = model.predict(input_sequence)
-        predicted_value = scaler.inverse_transform(predicted_scaled_value)
+    for year in range(last_known_year + 1, prediction_year + 1):
+        input_sequence[0, :, 0] = ring[(head + order) % sequence_length]
 
-        predictions.append({'country': country, 'year': year, 'energy_type': target_column, 'prediction': float(predicted_value[0][0])})
-        # Update the historical data for the next prediction (autoregressive)
-        new_data_point = pd.DataFrame({'country': [country], 'year': [year], target_column: [float(predicted_value[0][0])]})
-        data = pd.concat([data, new_data_point], ignore_index=True)
+        # calling the model directly skips the per-call setup of model.predict for a batch of one
+        predicted_scaled_value = float(np.asarray(model(input_sequence, training=False))[0][0])
+        predicted_value = (predicted_scaled_value - offset) / scale
 
+        predictions.append({'country': country, 'year': year, 'energy_type': target_column, 'prediction': float(predicted_value)})
+        # Update the window for the next prediction (autoregressive): the new value replaces the oldest
+        ring[head] = predicted_value * scale + offset
+        head = (head + 1) % sequence_length
 
     return predictions
 
 
+def predict_energy_year(model, scaler, data, country, prediction_year, sequence_length, target_column):
+    # if LSTM model predict only the next step value, if there are many steps to reach the required year
+    # the model should calculate all the steps till reach the required year
+    return forecast_energy_years(model, scaler, data, country, prediction_year, sequence_length, target_column)
 
 
+def predictions_up_to_year(predictions, year):
+    # The trajectory prefix that predict_energy_year would have returned for an earlier target year
+    if predictions is None:
+        return None
+    return [prediction for prediction in predictions if prediction['year'] <= year]
@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+# Profiles the live server for the next N requests matching a route filter (or a time window):
+# - 'sample': a background thread records the stack of each matching request every few milliseconds
+#   (sys._current_frames), cheap enough to run under real traffic. The result is a collapsed-stack
+#   file ('frame;frame;frame count' lines, the input of flamegraph.pl / speedscope) and a table of
+#   the functions most often on the stack.
+# - 'cprofile': every matching request runs under cProfile (exact call counts, slower), aggregated
+#   into a top-functions table.
+# Optionally a tracemalloc snapshot is taken at the start and the end, and the allocations that grew
+# the most in between are listed (by source line).
+# Only the thread handling a request is profiled: the work it hands to a pool (plot_batch, jobs) is not.
+
+profile_modes = ['sample', 'cprofile']
+top_rows = 30
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    # the frames from the outermost call to frame
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+class RequestProfiler:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._session = None
+        self._active = {}  # thread id -> (session, route, cProfile.Profile or None) of the matching requests being handled
+
+    def start(self, mode='sample', route=None, max_requests=20, seconds=60, interval=0.005, memory=False):
+        """
+        Starts a profiling session, unless one is already running.
+
+        :param mode: 'sample' or 'cprofile'.
+        :param route: Regular expression the request path must match (all requests if None).
+        :param max_requests: The session ends after this many matching requests...
+        :param seconds: ...or after this many seconds, whichever comes first.
+        :param interval: Seconds between two samples in 'sample' mode.
+        :param memory: Also compare tracemalloc snapshots taken at the start and the end.
+        :return: False if a session is already running.
+        :raises ValueError: For an unknown mode or an invalid route expression.
+        """
+        if mode not in profile_modes:
+            raise ValueError(f"Mode must be one of: {', '.join(profile_modes)}")
+        try:
+            route_pattern = re.compile(route) if route else None
+        except re.error as error:
+            raise ValueError(f"Invalid route expression: {error}")
+
+        with self._lock:
+            if self._session is not None and self._session['status'] != 'done':
+                return False
+            self._session = {
+                'mode': mode, 'route': route, 'route_pattern': route_pattern, 'max_requests': max_requests,
+                'seconds': seconds, 'interval': interval, 'memory': memory, 'status': 'running',
+                'started_at': time.time(), 'deadline': time.monotonic() + seconds, 'finished_at': None,
+                'requests': 0, 'samples': 0, 'stacks': Counter(), 'stats': None, 'skipped': 0,
+                'memory_start': None, 'started_tracing': False, 'memory_diff': None,
+            }
+            session = self._session
+
+        if memory:
+            session['started_tracing'] = not tracemalloc.is_tracing()
+            if session['started_tracing']:
+                tracemalloc.start(10)
+            session['memory_start'] = tracemalloc.take_snapshot()
+
+        # the sampler also ends a session whose time window is over
+        threading.Thread(target=self._sample, args=(session,), name='profiler', daemon=True).start()
+        return True
+
+    def stop(self):
+        # Ends the running session now
+        with self._lock:
+            session = self._session
+        if session is not None:
+            self._finish(session)
+
+    def request_started(self, route):
+        # Called on the thread handling a request, before its handler
+        with self._lock:
+            session = self._session
+            if session is None or session['status'] != 'running':
+                return
+            if session['route_pattern'] is not None and not session['route_pattern'].search(route):
+                return
+            profile = None
+            if session['mode'] == 'cprofile':
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # newer Pythons allow one active cProfile per process: this request is left out
+                    session['skipped'] += 1
+                    return
+            self._active[threading.get_ident()] = (session, route, profile)
+
+    def request_finished(self):
+        # Called on the thread handling a request, once it has been handled (also after an error)
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        if entry is None:
+            return
+        session, _, profile = entry
+        # a profile only stops on the thread it runs on, even when the session is already over
+        if profile is not None:
+            profile.disable()
+
+        with self._lock:
+            # requests still running when the session ended are left out of the result
+            if session['status'] != 'running':
+                return
+            if profile is not None:
+                if session['stats'] is None:
+                    session['stats'] = pstats.Stats(profile)
+                else:
+                    session['stats'].add(profile)
+            session['requests'] += 1
+            finished = session['requests'] >= session['max_requests']
+        if finished:
+            self._finish(session)
+
+    def _sample(self, session):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if session['status'] != 'running':
+                    return
+                routes = {thread_id: route for thread_id, (owner, route, _) in self._active.items() if owner is session}
+            if time.monotonic() >= session['deadline']:
+                self._finish(session)
+                return
+
+            if session['mode'] == 'sample' and routes:
+                frames = sys._current_frames()
+                stacks = [';'.join([route] + _stack(frames[thread_id]))
+                          for thread_id, route in routes.items() if thread_id in frames and thread_id != own_id]
+                with self._lock:
+                    session['stacks'].update(stacks)
+                    session['samples'] += len(stacks)
+            time.sleep(session['interval'] if session['mode'] == 'sample' else 0.1)
+
+    def _finish(self, session):
+        with self._lock:
+            if session['status'] != 'running':
+                return
+            session['status'] = 'finishing'
+
+        if session['memory']:
+            snapshot = tracemalloc.take_snapshot()
+            if session['started_tracing']:
+                tracemalloc.stop()
+            session['memory_diff'] = memory_diff(session['memory_start'], snapshot)
+            session['memory_start'] = None
+
+        with self._lock:
+            session['status'] = 'done'
+            session['finished_at'] = time.time()
+            self._done.notify_all()
+
+    def wait(self, timeout):
+        # Waits until the session is done (or timeout seconds)
+        with self._lock:
+            self._done.wait_for(lambda: self._session is None or self._session['status'] == 'done', timeout)
+
+    def status(self):
+        with self._lock:
+            session = self._session
+            if session is None:
+                return {'status': 'idle'}
+            return {key: session[key] for key in ('mode', 'route', 'max_requests', 'seconds', 'memory', 'status',
+                                                  'started_at', 'finished_at', 'requests', 'samples', 'skipped')}
+
+    def result(self):
+        """
+        :return: The status of the session with, once it is done, its top-functions table and memory diff.
+        """
+        result = self.status()
+        with self._lock:
+            session = self._session
+        if session is None or session['status'] != 'done':
+            return result
+
+        if session['mode'] == 'sample':
+            result['top'] = sample_table(session['stacks'])
+        else:
+            result['top'] = cprofile_table(session['stats'])
+        result['memory_diff'] = session['memory_diff']
+        return result
+
+    def collapsed_stacks(self):
+        # The samples of the last session, one 'frame;frame;frame count' line per distinct stack
+        with self._lock:
+            session = self._session
+            stacks = dict(session['stacks']) if session is not None else {}
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def sample_table(stacks):
+    # Samples where a function is running (self) or anywhere on the stack (total), the most self samples first
+    own, total = Counter(), Counter()
+    samples = sum(stacks.values())
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]  # without the route
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [
+        {'function': function, 'total_samples': count, 'total_percent': round(100 * count / samples, 1),
+         'self_samples': own[function], 'self_percent': round(100 * own[function] / samples, 1)}
+        for function, count in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:top_rows]
+    ]
+
+
+def cprofile_table(stats, sort='cumulative'):
+    # The functions with the most (cumulative) time, as pstats prints them
+    if stats is None:
+        return []
+    rows = []
+    for (filename, line, name), (primitive_calls, calls, own_time, cumulative_time, _) in stats.stats.items():
+        rows.append({'function': f"{name} ({os.path.basename(filename)}:{line})", 'calls': calls,
+                     'primitive_calls': primitive_calls, 'tottime': round(own_time, 6), 'cumtime': round(cumulative_time, 6)})
+    key = 'cumtime' if sort == 'cumulative' else 'tottime'
+    return sorted(rows, key=lambda row: row[key], reverse=True)[:top_rows]
+
+
+def memory_diff(start, end, limit=top_rows):
+    # The source lines whose allocations grew the most between two tracemalloc snapshots
+    # without the allocations of the profiling itself and of imports
+    ignored = [tracemalloc.Filter(False, path) for path in (tracemalloc.__file__, __file__, pstats.__file__, cProfile.__file__,
+                                                             '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')]
+    differences = end.filter_traces(ignored).compare_to(start.filter_traces(ignored), 'lineno')
+    return [
+        {'location': str(difference.traceback[0]), 'size_kb': round(difference.size / 1024, 1),
+         'size_diff_kb': round(difference.size_diff / 1024, 1), 'count_diff': difference.count_diff}
+        for difference in differences[:limit]
+    ]
@@ -0,0 +1,177 @@
+import os
+import json
+import base64
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Cache of rendered plot responses. The data is static between dataset reloads, so a response
+# is keyed by the route, its normalized parameters and the dataset version, and is reused until
+# the dataset changes. Entries live in an in-memory LRU and, optionally, in a directory on disk
+# that survives restarts and is shared by the worker processes.
+
+max_entries = 256
+max_bytes = 64 * 1024 * 1024
+disk_dir = None
+max_disk_entries = 4096
+
+_entries = OrderedDict()  # key -> (response, size_in_bytes)
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'disk_hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'render_seconds': 0.0,
+}
+
+
+def cache_key(route, params, dataset_version):
+    # None values are dropped, so a missing parameter and an explicit default don't make two entries
+    normalized = sorted((name, value) for name, value in params.items() if value is not None)
+    return json.dumps([route, normalized, str(dataset_version)], default=str)
+
+
+def _encode_bytes(value):
+    # image bytes (png / svg responses) are stored as base64 in the JSON files
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(value):
+    if set(value) == {'__bytes__'}:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def _disk_path(key):
+    return os.path.join(disk_dir, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+
+def _read_disk(key):
+    if not disk_dir:
+        return None
+    try:
+        with open(_disk_path(key)) as f:
+            stored = json.load(f, object_hook=_decode_bytes)
+    except (OSError, ValueError):
+        return None
+    # the file name is a hash, the key inside guards against collisions
+    return stored['response'] if stored.get('key') == key else None
+
+
+def _write_disk(key, response):
+    if not disk_dir:
+        return
+    os.makedirs(disk_dir, exist_ok=True)
+    path = _disk_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'response': response}, f, default=_encode_bytes)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError):
+        # responses that can't be stored as JSON are only cached in memory
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _prune_disk()
+
+
+def _prune_disk():
+    files = [os.path.join(disk_dir, name) for name in os.listdir(disk_dir) if name.endswith('.json')]
+    if len(files) <= max_disk_entries:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - max_disk_entries]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _size(response):
+    try:
+        return len(json.dumps(response, default=_encode_bytes))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _store(key, response):
+    size = _size(response)
+    _entries[key] = (response, size)
+    _entries.move_to_end(key)
+    resident_bytes = sum(entry[1] for entry in _entries.values())
+    while len(_entries) > 1 and (len(_entries) > max_entries or resident_bytes > max_bytes):
+        _, (_, evicted_size) = _entries.popitem(last=False)
+        resident_bytes -= evicted_size
+        _stats['evictions'] += 1
+
+
+def get_or_render(route, params, dataset_version, render):
+    """
+    Returns the cached response for a route and its parameters, or calls render() and caches its result.
+
+    :param route: The route path, e.g. '/plot_energy_type'.
+    :param params: The normalized parameters the response depends on.
+    :param dataset_version: Version of the dataset the response was rendered from.
+    :param render: Function producing the response; exceptions are not cached.
+    """
+    key = cache_key(route, params, dataset_version)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[0]
+
+    response = _read_disk(key)
+    if response is not None:
+        with _lock:
+            _stats['disk_hits'] += 1
+            _store(key, response)
+        return response
+
+    start = time.perf_counter()
+    response = render()
+    with _lock:
+        _stats['misses'] += 1
+        _stats['render_seconds'] += time.perf_counter() - start
+        _store(key, response)
+    _write_disk(key, response)
+    return response
+
+
+def configure_response_cache(max_cached_entries=None, max_cached_bytes=None, cache_dir=None, max_cached_files=None):
+    global max_entries, max_bytes, disk_dir, max_disk_entries
+    with _lock:
+        if max_cached_entries is not None:
+            max_entries = max_cached_entries
+        if max_cached_bytes is not None:
+            max_bytes = max_cached_bytes
+        if cache_dir is not None:
+            disk_dir = cache_dir or None
+        if max_cached_files is not None:
+            max_disk_entries = max_cached_files
+
+
+def clear_response_cache(remove_files=False):
+    # Entries of an older dataset version are never served, this only frees their memory (and files)
+    with _lock:
+        _entries.clear()
+    if remove_files and disk_dir and os.path.isdir(disk_dir):
+        for name in os.listdir(disk_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(disk_dir, name))
+
+
+def response_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_entries)
+        stats['bytes'] = sum(entry[1] for entry in _entries.values())
+    requests = stats['hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / requests if requests else 0.0
+    return stats
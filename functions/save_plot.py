@@ -1,17 +1,28 @@
-import io
 import base64
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import hashlib
 
-def save_plot(plt):
-    # Save the plot to a bytes object
-    img = io.BytesIO()
-    plt.savefig(img, format='png', bbox_inches='tight')
-    img.seek(0)
+from functions.plot_renderer import render_figure
+
+# What a plot function can return: the <img> html (default), only the data (nothing is drawn),
+# or the raw image bytes
+plot_outputs = ['html', 'data', 'png', 'svg']
+image_mimetypes = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def save_plot(fig, dpi=None):
+    # Save the figure to png bytes
+    img = render_figure(fig, 'png', dpi)
 
     # Encode the bytes object as a base64 string
-    plot_url = base64.b64encode(img.getvalue()).decode()
-    plt.close()
+    plot_url = base64.b64encode(img).decode()
+
+    return plot_url
+
+def plot_output(fig, data, output='html', dpi=None):
+    # The result of a plot function for the requested output (see plot_outputs)
+    if output in image_mimetypes:
+        image = render_figure(fig, output, dpi)
+        return {"data": data, "image": image, "mimetype": image_mimetypes[output], "etag": hashlib.sha256(image).hexdigest()}
 
-    return plot_url
\ No newline at end of file
+    plot_url = save_plot(fig, dpi)
+    # Return the plot as an HTML <img> tag
+    return {"data": data, "img": f"<img src='data:image/png;base64,{plot_url}'/>"}
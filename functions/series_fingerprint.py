@@ -0,0 +1,47 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from functions.dataset_index import country_rows
+
+# Fingerprint of the series a model was trained on: the (year, target) rows that
+# create_sequences takes for a country. Stored next to the model, so retraining can
+# skip the models whose input didn't change in a new release of the dataset.
+
+
+def series_fingerprint(data, country, target_column, sequence_length):
+    # the country's rows, sorted by year, come from the dataset index create_sequences builds (no scan of 'country')
+    country_data = country_rows(data, country)
+
+    digest = hashlib.sha256()
+    digest.update(f"{target_column}:{sequence_length}:".encode())
+    digest.update(np.ascontiguousarray(country_data['year'].to_numpy(dtype=np.int64)).tobytes())
+    digest.update(np.ascontiguousarray(country_data[target_column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_path(model_path):
+    # saved_models/<country>/<energy>/<country>_<energy>_consumption.h5 -> ..._consumption.fingerprint.json
+    return os.path.splitext(model_path)[0] + '.fingerprint.json'
+
+
+def read_fingerprint(model_path):
+    try:
+        with open(fingerprint_path(model_path)) as f:
+            return json.load(f).get('fingerprint')
+    except (OSError, ValueError):
+        return None
+
+
+def write_fingerprint(model_path, fingerprint, **details):
+    with open(fingerprint_path(model_path), 'w') as f:
+        json.dump({'fingerprint': fingerprint, **details}, f, indent=2)
+
+
+def series_changed(data, country, target_column, sequence_length, model_path, scaler_path):
+    # True when there is no trained model yet, or the series differs from the one it was trained on
+    if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+        return True
+    return read_fingerprint(model_path) != series_fingerprint(data, country, target_column, sequence_length)
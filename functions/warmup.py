@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from functions import model_registry
+from functions.model_registry import get_model_and_scaler
+from functions.forecast_store import saved_model_types
+
+# Warm-up of a worker before it takes traffic, declared in a JSON spec (warmup.json):
+#     {"models": ["Germany/*", "France/wind"],
+#      "charts": [{"chart": "renewable_energy_sources_over_time"},
+#                 {"chart": "energy_type", "country": "World", "energy_type": "solar_electricity",
+#                  "start_year": 2000, "end_year": 2023, "format": "data"}]}
+# The models are loaded into the model registry and run once on a dummy window (TensorFlow traces its
+# graph on the first call), and the charts are rendered into the response cache, so the first requests
+# after a deploy don't pay for it. It runs every time a dataset is swapped in (the response cache is
+# cleared then); the worker is ready once it has completed the first time.
+
+_lock = threading.Lock()
+_status = {
+    'state': 'pending',
+    'runs': 0,
+    'completed_at': None,
+    'seconds': 0.0,
+    'models': 0,
+    'charts': 0,
+    'errors': [],
+}
+
+
+def load_warmup_spec(path):
+    """
+    Reads a warm-up spec.
+
+    :return: {'models': [...], 'charts': [...]}, or None if path is empty or the file doesn't exist.
+    :raises ValueError: If the file is not a valid spec.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict) or not isinstance(spec.get('models', []), list) or not isinstance(spec.get('charts', []), list):
+        raise ValueError(f"{path} must be an object with a 'models' and a 'charts' list")
+    return {'models': spec.get('models', []), 'charts': spec.get('charts', [])}
+
+
+def expand_models(entries, models_dir=None):
+    # 'Country/energy' entries, 'Country/*' meaning every saved model of the country
+    models_dir = models_dir or model_registry.models_dir
+    pairs = []
+    for entry in entries:
+        country, _, energy_type = str(entry).partition('/')
+        if energy_type == '*':
+            if os.path.isdir(models_dir):
+                pairs.extend(pair for pair in saved_model_types(models_dir) if pair[0] == country)
+        elif country and energy_type:
+            pairs.append((country, energy_type))
+    return list(dict.fromkeys(pairs))
+
+
+def warm_models(pairs, sequence_length=5):
+    """
+    Loads the models into the registry and runs each once on a window of zeros.
+
+    :return: The number of models warmed, and the errors as a list of strings.
+    """
+    dummy_window = np.zeros((1, sequence_length, 1), dtype=np.float32)
+    warmed, errors = 0, []
+    for country, energy_type in pairs[:model_registry.max_models]:
+        model, scaler = get_model_and_scaler(country, energy_type, count_request=False)
+        if model is None or scaler is None:
+            errors.append(f"model {country}/{energy_type}: not found")
+            continue
+        try:
+            model(dummy_window, training=False)
+            warmed += 1
+        except Exception as error:  # a broken model shouldn't stop the warm-up of the others
+            errors.append(f"model {country}/{energy_type}: {error}")
+    if len(pairs) > model_registry.max_models:
+        errors.append(f"only the first {model_registry.max_models} models were warmed (the registry keeps {model_registry.max_models})")
+    return warmed, errors
+
+
+def warm_charts(charts, render_chart):
+    # Renders every chart spec with render_chart(spec), which puts it in the response cache
+    rendered, errors = 0, []
+    for spec in charts:
+        try:
+            render_chart(spec)
+            rendered += 1
+        except Exception as error:  # nor a chart that fails to render
+            errors.append(f"chart {json.dumps(spec)}: {error}")
+    return rendered, errors
+
+
+def run_warmup(spec, render_chart, sequence_length=5):
+    """
+    Warms the models and renders the charts of a spec (None: nothing to warm).
+
+    :param render_chart: Function rendering a chart spec into the response cache.
+    """
+    with _lock:
+        _status['state'] = 'running'
+    started = time.perf_counter()
+
+    spec = spec or {'models': [], 'charts': []}
+    models, model_errors = warm_models(expand_models(spec['models']), sequence_length)
+    charts, chart_errors = warm_charts(spec['charts'], render_chart)
+    for error in model_errors + chart_errors:
+        print(f"Warning: warm-up {error}")
+
+    with _lock:
+        _status.update(state='done', completed_at=time.time(), seconds=round(time.perf_counter() - started, 3),
+                       models=models, charts=charts, errors=model_errors + chart_errors)
+        _status['runs'] += 1
+
+
+def warmup_completed():
+    # True once a warm-up has completed (a later one, after a dataset refresh, doesn't make the worker unready)
+    with _lock:
+        return _status['completed_at'] is not None
+
+
+def warmup_status():
+    with _lock:
+        return {**_status, 'errors': list(_status['errors'])}
@@ -0,0 +1,72 @@
+import threading
+import weakref
+
+from functions.load_cleaned_dataset import source_values
+
+# Per-year totals, means and top-k country rankings of a set of columns, computed for all years
+# at once when the dataset is loaded, so the /get_* analytics handlers only look them up instead
+# of filtering the year and summing / ranking on every request.
+# Aggregate rows of the OWID file (World, continents, income groups, the regions of the EI /
+# Ember / EIA sources, ...) are left out: they would count the countries twice in the totals and
+# take the first places of the rankings.
+
+aggregate_regions = {
+    'World', 'Africa', 'Asia', 'Europe', 'North America', 'South America', 'Oceania',
+    'European Union (27)', 'High-income countries', 'Low-income countries',
+    'Lower-middle-income countries', 'Upper-middle-income countries',
+}
+# suffixes of the regions some OWID sources define, e.g. 'Asia Pacific (EI)', 'G20 (Ember)'
+aggregate_suffixes = ('(EI)', '(Ember)', '(EIA)', '(BP)', '(Shift)', 'income countries')
+
+
+def is_aggregate_region(country):
+    country = str(country)
+    return country in aggregate_regions or country.endswith(aggregate_suffixes)
+
+
+class YearlyRollups:
+
+    def __init__(self, data, columns, top_k=5):
+        columns = [column for column in columns if column in data.columns]
+        self.columns = set(columns)
+        self.years = {int(year) for year in data['year'].unique()}
+
+        countries = data[~data['country'].map(is_aggregate_region).to_numpy(dtype=bool)]
+        # summed and averaged as the source values in compact mode too
+        countries = source_values(countries[['year', 'country'] + columns])
+        grouped = countries.groupby('year')[columns]
+        years = sorted(self.years)
+        # {year: {column: value}}
+        self.totals = grouped.sum().reindex(years, fill_value=0.0).to_dict(orient='index')
+        self.means = grouped.mean().reindex(years).to_dict(orient='index')
+
+        # {year: {column: [country, ...]}}, largest first; ties keep the file order, like nlargest
+        self.top = {year: {} for year in years}
+        for column in columns:
+            ranked = countries[['year', 'country', column]].sort_values(['year', column], ascending=[True, False], kind='stable')
+            for year, names in ranked.groupby('year', sort=False).head(top_k).groupby('year', sort=False)['country']:
+                self.top[int(year)][column] = names.tolist()
+        for year in years:
+            for column in columns:
+                self.top[year].setdefault(column, [])
+
+
+_rollups = {}  # (id(DataFrame), columns, top_k) -> (weak reference to the DataFrame, YearlyRollups)
+_lock = threading.Lock()
+
+
+def get_yearly_rollups(data, columns, top_k=5):
+    """
+    Returns the yearly rollups of some columns of a DataFrame, computing them the first time
+    they are asked for. They are dropped when the DataFrame is garbage collected.
+    """
+    key = (id(data), tuple(columns), top_k)
+    with _lock:
+        entry = _rollups.get(key)
+        if entry is not None and entry[0]() is data:
+            return entry[1]
+
+    rollups = YearlyRollups(data, columns, top_k)
+    with _lock:
+        _rollups[key] = (weakref.ref(data, lambda _, key=key: _rollups.pop(key, None)), rollups)
+    return rollups
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# use the sys path, so the functions package can be imported when the tests are run from another directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# the parity is checked against Keras, so the tests only run where TensorFlow (and sklearn) are installed
+pytest.importorskip('tensorflow')
+pytest.importorskip('sklearn')
+
+from sklearn.preprocessing import MinMaxScaler
+
+from functions.create_lstm_model import build_lstm_model, save_model_and_scaler
+from functions.export_numpy_weights import export_model, verify_export
+from functions.lstm_numpy import lstm_weights_from_keras, load_numpy_model, NumpyLSTMModel
+
+sequence_length = 5
+tolerance = 1e-5
+
+
+@pytest.fixture
+def saved_model(tmp_path):
+    # a small untrained model of the architecture build_lstm_model trains, with a fitted scaler
+    model = build_lstm_model(lstm_units=8, sequence_length=sequence_length)
+    scaler = MinMaxScaler().fit(np.linspace(3.0, 250.0, 40).reshape(-1, 1))
+    model_path = str(tmp_path / 'Test_wind_consumption.h5')
+    scaler_path = str(tmp_path / 'Test_wind_consumption_scaler.pkl')
+    save_model_and_scaler(model, scaler, model_path, scaler_path)
+    return model, scaler, model_path, scaler_path
+
+
+def random_windows(samples=64, seed=0):
+    # scaled windows, a bit outside [0, 1] like the autoregressive rollouts
+    return np.random.default_rng(seed).uniform(-0.5, 1.5, size=(samples, sequence_length, 1)).astype(np.float32)
+
+
+def test_numpy_forward_pass_matches_keras(saved_model):
+    model, _, _, _ = saved_model
+    inputs = random_windows()
+
+    keras_output = np.asarray(model(inputs, training=False))
+    numpy_output = NumpyLSTMModel(lstm_weights_from_keras(model))(inputs)
+
+    assert numpy_output.shape == keras_output.shape
+    assert np.allclose(numpy_output, keras_output, rtol=0, atol=tolerance)
+
+
+def test_exported_model_matches_keras(saved_model):
+    _, scaler, model_path, scaler_path = saved_model
+
+    export_path = export_model(model_path, scaler_path)
+    numpy_model, numpy_scaler = load_numpy_model(export_path, source_path=model_path)
+
+    assert numpy_model is not None
+    assert verify_export(model_path, scaler_path) <= tolerance
+    values = np.array([[3.0], [42.0], [250.0], [300.0]])
+    assert np.allclose(numpy_scaler.transform(values), scaler.transform(values))
+    assert np.allclose(numpy_scaler.inverse_transform(scaler.transform(values)), values)
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import subprocess
+
+# use the sys path, so the functions package can be imported when the tests are run from another directory
+repository_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(repository_dir)
+
+from functions import model_registry
+
+# runs in a fresh interpreter, where TensorFlow can't have been imported by another test
+missing_model_script = '''
+import sys, json
+from functions.model_registry import configure_registry, get_model_and_scaler, registry_stats
+configure_registry(saved_models_dir=sys.argv[1])
+results = [get_model_and_scaler('Nowhere', 'wind'), get_model_and_scaler('Germany', 'nuclear')]
+print(json.dumps({'results': [[model, scaler] for model, scaler in results],
+                  'tensorflow': 'tensorflow' in sys.modules, 'load_failures': registry_stats()['load_failures']}))
+'''
+
+
+def test_missing_model_does_not_import_tensorflow(tmp_path):
+    os.makedirs(tmp_path / 'Germany' / 'wind')
+    completed = subprocess.run([sys.executable, '-c', missing_model_script, str(tmp_path)], cwd=repository_dir,
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    assert result['results'] == [[None, None], [None, None]]
+    assert result['load_failures'] == 2
+    assert not result['tensorflow']
+
+
+def test_missing_model_is_not_cached(tmp_path):
+    model_registry.configure_registry(saved_models_dir=str(tmp_path))
+    try:
+        assert model_registry.get_model_and_scaler('Nowhere', 'wind') == (None, None)
+        assert model_registry.registry_stats()['resident_models'] == 0
+    finally:
+        model_registry.configure_registry(saved_models_dir='saved_models')